@@ -0,0 +1,159 @@
+import asyncio
+import re
+import time
+from functools import partial
+from typing import NamedTuple
+
+from cache import MISS, normalize_question
+from metrics import metrics
+from rollups import route_to_rollups
+from sargable import day_range, rewrite_sargable
+from sql_rules import match_rule
+
+KEY_RE = re.compile(
+    r'(?P<expr>DATE\(\s*(?P<col>(?:\w+\.)?\w+)\s*\)|(?<![\w.])(?:\w+\.)?\w+)\s*=\s*\$(?P<n>\d+)::(?P<cast>text|date)\b',
+    re.IGNORECASE,
+)
+SELECT_RE = re.compile(r'^\s*SELECT\s+', re.IGNORECASE)
+UNGROUPABLE_RE = re.compile(r'\b(?:GROUP\s+BY|ORDER\s+BY|LIMIT|HAVING|UNION|OR)\b', re.IGNORECASE)
+
+
+class Group(NamedTuple):
+    rule: str
+    sql: str
+    args: list
+    keys: dict
+
+
+class BatchResult(NamedTuple):
+    answers: list
+    elapsed: float
+    solo_seconds: float
+    groups: list
+
+    @property
+    def saved_seconds(self):
+        return self.solo_seconds - self.elapsed
+
+
+def key_params(sql_query: str):
+    if not SELECT_RE.match(sql_query) or UNGROUPABLE_RE.search(sql_query):
+        return {}
+    params = {}
+    for m in KEY_RE.finditer(sql_query):
+        n = m.group('n')
+        if len(re.findall(rf'\${n}(?!\d)', sql_query)) == 1:
+            params[int(n) - 1] = m
+    return params
+
+
+def group_sql(sql_query: str, m, arg_count: int):
+    expr, n, cast = m.group('expr'), m.group('n'), m.group('cast')
+    condition = f'{expr} = ANY(${n}::{cast}[])'
+    if m.group('col'):
+        condition += f" AND {day_range(m.group('col'), f'${arg_count + 1}::date', f'${arg_count + 2}::date')}"
+    grouped = sql_query[:m.start()] + condition + sql_query[m.end():]
+    grouped = SELECT_RE.sub(lambda _: f'SELECT {expr}, ', grouped, count=1)
+    return grouped.rstrip().rstrip(';') + ' GROUP BY 1'
+
+
+def plan_groups(matched, use_rollups: bool = True):
+    by_rule = {}
+    for index, match in matched:
+        by_rule.setdefault(match.name, []).append((index, match))
+    groups = []
+    single = []
+    for rule, items in by_rule.items():
+        base = items[0][1].sql
+        base = (route_to_rollups(base) if use_rollups else None) or base
+        best = None
+        for pos, m in key_params(base).items():
+            buckets = {}
+            for index, match in items:
+                rest = tuple(arg for i, arg in enumerate(match.args) if i != pos)
+                buckets.setdefault(rest, []).append((index, match))
+            if best is None or len(buckets) < len(best[2]):
+                best = (pos, m, buckets)
+        if best is None:
+            single += [index for index, _ in items]
+            continue
+        pos, m, buckets = best
+        for bucket in buckets.values():
+            keys = {}
+            for index, match in bucket:
+                keys.setdefault(match.args[pos], []).append(index)
+            if len(keys) < 2:
+                single += [index for index, _ in bucket]
+                continue
+            values = sorted(keys)
+            args = list(bucket[0][1].args)
+            args[pos] = tuple(values)
+            if m.group('col'):
+                args += [values[0], values[-1]]
+            groups.append(Group(rule, rewrite_sargable(group_sql(base, m, len(bucket[0][1].args))), args, keys))
+    return groups, single
+
+
+async def answer_batch(pipeline, questions, concurrency: int = None):
+    started = time.perf_counter()
+    version = await pipeline.db.data_version()
+    answers = [None] * len(questions)
+    solo = [0.0] * len(questions)
+    matched = []
+    single = []
+    for index, question in enumerate(questions):
+        match = match_rule(question) if pipeline.columnar is None else None
+        if match is None:
+            single.append(index)
+            continue
+        answer = pipeline.answer_cache.get(normalize_question(question), version)
+        if answer is MISS:
+            matched.append((index, match))
+        else:
+            metrics.inc('requests_total', path='answer_cache')
+            answers[index] = answer
+    groups, ungrouped = plan_groups(matched, pipeline.use_rollups)
+    single = sorted(single + ungrouped)
+
+    async def run_group(group):
+        group_started = time.perf_counter()
+        execute = partial(pipeline.db.execute_query, rows=True)
+        try:
+            with metrics.timer('db_execute'):
+                rows = await pipeline.db_stage.run(execute, group.sql, *group.args)
+        except Exception as e:
+            for indexes in group.keys.values():
+                for index in indexes:
+                    answers[index] = e
+            return
+        values = {row[0]: row[1] for row in rows}
+        elapsed = time.perf_counter() - group_started
+        size = sum(len(indexes) for indexes in group.keys.values())
+        estimate = pipeline.latency.get(group.rule, elapsed)
+        for key, indexes in group.keys.items():
+            value = values.get(key)
+            answer = '0' if value is None else str(int(value))
+            for index in indexes:
+                answers[index] = answer
+                solo[index] = estimate
+                pipeline.answer_cache.set(normalize_question(questions[index]), answer, elapsed / size, version)
+        metrics.inc('requests_total', size, path='batch_group')
+        metrics.observe('request_seconds', elapsed, path='batch_group')
+
+    semaphore = asyncio.Semaphore(concurrency or pipeline.llm_stage.concurrency + 1)
+
+    async def run_single(index):
+        async with semaphore:
+            single_started = time.perf_counter()
+            try:
+                answers[index] = await pipeline.answer(questions[index])
+            except Exception as e:
+                answers[index] = e
+            solo[index] = time.perf_counter() - single_started
+
+    await asyncio.gather(*(run_group(group) for group in groups), *(run_single(index) for index in single))
+    elapsed = time.perf_counter() - started
+    result = BatchResult(answers, elapsed, sum(solo), [(group.rule, len(group.keys)) for group in groups])
+    metrics.inc('batch_questions_total', len(questions))
+    metrics.inc('batch_saved_seconds_total', max(result.saved_seconds, 0.0))
+    return result
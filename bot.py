@@ -1,25 +1,106 @@
 import asyncio
-import re
+import logging
+import multiprocessing
+import os
+import signal
 import sys
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
 from os import getenv
 from dotenv import load_dotenv
 
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-from database import Database
+from batch import answer_batch
+from cache import ResultCache
+from database import Database, QueryRejected
 from llm_query import LLMQueryBuilder
+from metrics import metrics
+from pipeline import Busy, QueryPipeline
+from shared_store import SharedStore
+from template_cache import TemplateCache
 
 load_dotenv()
 
-bot = Bot(token=getenv('TELEGRAM_BOT_TOKEN'))
+cache_ttl = float(getenv('CACHE_TTL', '300'))
+cache_max_size = int(getenv('CACHE_MAX_SIZE', '1024'))
+use_rollups = getenv('USE_ROLLUPS', '1') == '1'
+use_columnar = getenv('USE_COLUMNAR', '0') == '1'
+bot_mode = getenv('BOT_MODE', 'polling')
+bot_workers = int(getenv('BOT_WORKERS', '1'))
+webhook_url = getenv('WEBHOOK_URL', '')
+webhook_path = getenv('WEBHOOK_PATH', '/webhook')
+webhook_secret = getenv('WEBHOOK_SECRET') or None
+webhook_host = getenv('WEBHOOK_HOST', '0.0.0.0')
+webhook_port = int(getenv('WEBHOOK_PORT', '8080'))
+shared_store_path = getenv('SHARED_STORE_PATH') or ('shared_store.sqlite3' if bot_workers > 1 else '')
+rate_limit = int(getenv('RATE_LIMIT_PER_MINUTE', '0'))
+batch_max_questions = int(getenv('BATCH_MAX_QUESTIONS', '50'))
+telegram_api_url = getenv('TELEGRAM_API_URL')
+
+bot = Bot(
+    token=getenv('TELEGRAM_BOT_TOKEN'),
+    session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_api_url)) if telegram_api_url else None,
+)
 dp = Dispatcher()
-db = Database(getenv('DATABASE_URL'))
+db = Database(
+    getenv('DATABASE_URL'),
+    cache=ResultCache(cache_max_size, cache_ttl),
+    statement_timeout_ms=int(getenv('QUERY_TIMEOUT_MS', '10000')),
+    max_cost=float(getenv('QUERY_MAX_COST', '1000000')),
+    max_rows=float(getenv('QUERY_MAX_ROWS', '50000000')),
+)
+store = SharedStore(shared_store_path or ':memory:')
+if shared_store_path:
+    answer_cache = store.cache('answers', cache_max_size, cache_ttl)
+else:
+    answer_cache = ResultCache(cache_max_size, cache_ttl)
+templates = TemplateCache(getenv('TEMPLATE_CACHE_PATH', 'sql_templates.json'))
 ollama_url = getenv('OLLAMA_URL', 'http://localhost:11434')
 ollama_model = getenv('OLLAMA_MODEL', 'gemma3:4b')
-llm = LLMQueryBuilder(ollama_url=ollama_url, model=ollama_model)
+ollama_check = None
+llm = LLMQueryBuilder(
+    ollama_url=ollama_url,
+    model=ollama_model,
+    stream=getenv('OLLAMA_STREAM', '1') == '1',
+    keep_alive=getenv('OLLAMA_KEEP_ALIVE', '30m'),
+    compact_schema=getenv('OLLAMA_COMPACT_SCHEMA', '0') == '1',
+    fast_model=getenv('OLLAMA_FAST_MODEL') or None,
+    speculative=getenv('OLLAMA_SPECULATIVE', '0') == '1',
+    parallel=int(getenv('OLLAMA_NUM_PARALLEL', '1')),
+)
+if use_columnar:
+    from columnar import ColumnStore
+    columnar = ColumnStore()
+else:
+    columnar = None
+pipeline = QueryPipeline(
+    db, llm, templates, answer_cache,
+    llm_concurrency=int(getenv('LLM_CONCURRENCY', '1')),
+    llm_queue_size=int(getenv('LLM_QUEUE_SIZE', '8')),
+    db_concurrency=int(getenv('DB_CONCURRENCY', '5')),
+    db_queue_size=int(getenv('DB_QUEUE_SIZE', '32')),
+    use_rollups=use_rollups,
+    columnar=columnar,
+)
+metrics_port = int(getenv('METRICS_PORT', '9108'))
+metrics_host = getenv('METRICS_HOST', '127.0.0.1')
+logger = logging.getLogger(__name__)
+
+metrics.gauge('queue_active', lambda: {
+    (('stage', stage.name),): stage.active for stage in (pipeline.llm_stage, pipeline.db_stage)
+}, 'Выполняется сейчас в этапе конвейера')
+metrics.gauge('queue_waiting', lambda: {
+    (('stage', stage.name),): stage.waiting for stage in (pipeline.llm_stage, pipeline.db_stage)
+}, 'Ждут места в этапе конвейера')
+metrics.gauge('db_pool_connections', lambda: {
+    (('state', 'total'),): db.pool.get_size(), (('state', 'idle'),): db.pool.get_idle_size(),
+} if db.pool else {}, 'Соединения пула asyncpg')
 
 
 @dp.message(Command('start'))
@@ -27,150 +108,110 @@ async def start_handler(message: types.Message):
     await message.answer('Привет! Задай вопрос о статистике видео на русском языке.')
 
 
-def get_fixed_sql_for_question(user_query: str):
-    q = user_query.lower()
-    creator_match = re.search(r'id\s+([a-f0-9]{32})', user_query, re.IGNORECASE)
-
-    if creator_match and ('просмотр' in q and ('вырос' in q or 'прирост' in q or 'изменени' in q or 'сложить' in q)):
-        date_match = re.search(r'(\d+)\s+ноября\s+2025', user_query, re.IGNORECASE)
-        time_match = re.search(r'с\s+(\d+):?\d*\s+до\s+(\d+):?\d*', user_query, re.IGNORECASE)
-        if date_match and time_match:
-            day = int(date_match.group(1))
-            h1, h2 = int(time_match.group(1)), int(time_match.group(2))
-            cid = creator_match.group(1)
-            return (
-                f"SELECT COALESCE(SUM(vs.delta_views_count), 0) FROM video_snapshots vs "
-                f"JOIN videos v ON vs.video_id = v.id WHERE v.creator_id = '{cid}' "
-                f"AND DATE(vs.created_at) = '2025-11-{day:02d}' "
-                f"AND EXTRACT(HOUR FROM vs.created_at) >= {h1} AND EXTRACT(HOUR FROM vs.created_at) < {h2}"
+@dp.message(Command('cachestats'))
+async def cache_stats_handler(message: types.Message):
+    lines = []
+    for name, cache in (('Ответы', answer_cache), ('SQL', db.cache)):
+        st = cache.stats()
+        lines.append(
+            f"{name}: попаданий {st['hits']}, промахов {st['misses']} ({st['hit_rate']:.0%}), "
+            f"записей {st['size']}, сэкономлено {st['saved_seconds']:.1f} с"
+        )
+    st = templates.stats()
+    lines.append(
+        f"Шаблоны SQL: попаданий {st['hits']}, промахов {st['misses']} ({st['hit_rate']:.0%}), "
+        f"шаблонов {st['size']}"
+    )
+    for name, st in (('LLM', pipeline.llm_stage.stats()), ('БД', pipeline.db_stage.stats())):
+        lines.append(
+            f"Очередь {name}: выполняется {st['active']}/{st['concurrency']}, ждёт {st['waiting']}/{st['queue_size']}, "
+            f"отказов {st['rejected']}, среднее ожидание {st['avg_wait']:.2f} с"
+        )
+    lines.append(f"Объединено одинаковых вопросов: {pipeline.coalesced}")
+    if rate_limit:
+        lines.append(f"Ограничено по частоте ({rate_limit}/мин): {store.limited}")
+    if columnar is not None:
+        st = columnar.stats()
+        lines.append(
+            f"Колоночное хранилище: версия {st['version']}, видео {st['videos']}, часов {st['hours']}, "
+            f"{st['bytes'] / 2 ** 20:.1f} МБ, обновлений {st['full_refreshes']} полных / "
+            f"{st['incremental_refreshes']} инкрементальных, последнее {st['refresh_seconds']:.2f} с"
+        )
+    st = llm.timings
+    if st['calls']:
+        line = f"Ollama: вызовов {st['calls']}"
+        if st['eval_calls']:
+            line += (
+                f", с таймингами {st['eval_calls']}: на вызов prompt eval "
+                f"{st['prompt_eval_seconds'] / st['eval_calls']:.2f} с "
+                f"({st['prompt_eval_count'] / st['eval_calls']:.0f} ток.), "
+                f"eval {st['eval_seconds'] / st['eval_calls']:.2f} с"
+            )
+        else:
+            line += ", тайминги prompt eval/eval не пришли (стрим остановлен до итогового фрагмента)"
+        if st['stream_calls']:
+            line += (
+                f"; до первого фрагмента стрима (≈ prompt eval) "
+                f"{st['first_chunk_seconds'] / st['stream_calls']:.2f} с"
             )
+        lines.append(line)
+    if len(llm.models) > 1:
+        for model, st in llm.tiers.items():
+            finished = st['accepted'] + st['rejected'] + st['failed']
+            lines.append(
+                f"Модель {model}: вызовов {st['calls']}, принято {st['accepted']} "
+                f"({st['accepted'] / finished if finished else 0:.0%}), отклонено проверками {st['rejected']}, "
+                f"ошибок {st['failed']}, отменено {st['cancelled']}, "
+                f"среднее время {st['seconds'] / finished if finished else 0:.2f} с"
+            )
+    await message.answer('\n'.join(lines))
 
-    if ('суммарн' in q or 'набрали' in q) and 'просмотр' in q and ('опубликован' in q or 'июн' in q):
-        if 'июн' in q and '2025' in q:
-            return "SELECT COALESCE(SUM(views_count), 0) FROM videos WHERE DATE(video_created_at) BETWEEN '2025-06-01' AND '2025-06-30'"
 
-    if ('замеров' in q or 'замеры' in q) and ('отрицательн' in q or 'уменьшились' in q or 'стало меньше' in q) and 'просмотр' in q:
-        return "SELECT COUNT(*) FROM video_snapshots WHERE delta_views_count < 0"
+def error_reply(error: Exception) -> str:
+    if isinstance(error, Busy):
+        return 'Сейчас много запросов, повторите вопрос чуть позже'
+    if isinstance(error, QueryRejected):
+        return 'Запрос получился слишком тяжёлым, уточните период или креатора'
+    return 'Произошла ошибка при обработке запроса'
 
-    if creator_match and ('разных календарных днях' in q or 'разных днях' in q or 'скольких днях' in q) and ('ноября 2025' in q or 'ноябрь 2025' in q) and ('публиковал' in q or 'видео' in q):
-        cid = creator_match.group(1)
-        return (
-            f"SELECT COUNT(DISTINCT DATE(video_created_at)) FROM videos "
-            f"WHERE creator_id = '{cid}' AND video_created_at >= '2025-11-01' AND video_created_at < '2025-12-01'"
-        )
 
-    if ('разных креаторов' in q or 'разных креатор' in q) and ('хотя бы одно видео' in q or ('имеют' in q and 'видео' in q)) and 'просмотр' in q:
-        views_match = re.search(r'больше\s+(\d[\d\s]*)', user_query, re.IGNORECASE)
-        if views_match:
-            threshold = int(views_match.group(1).replace(' ', ''))
-            return f"SELECT COUNT(DISTINCT creator_id) FROM videos WHERE views_count > {threshold}"
-
-    creator_match = re.search(r'id\s+([a-f0-9]{32})', user_query, re.IGNORECASE)
-    period_patterns = [
-        (r'с\s+(\d+)\s+ноября\s+2025\s+по\s+(\d+)\s+ноября\s+2025', 11),
-        (r'с\s+(\d+)\s+по\s+(\d+)\s+ноября\s+2025', 11),
-        (r'период\s+с\s+(\d+)\s+ноября\s+2025\s+по\s+(\d+)\s+ноября\s+2025', 11),
-    ]
-    if creator_match and ('креатор' in q or 'креатора' in q) and ('видео' in q or 'опубликовал' in q) and ('период' in q or 'ноября' in q):
-        for pat, month in period_patterns:
-            m = re.search(pat, user_query, re.IGNORECASE)
-            if m:
-                d1, d2 = int(m.group(1)), int(m.group(2))
-                start_date = f'2025-{month:02d}-{d1:02d}'
-                end_date = f'2025-{month:02d}-{d2:02d}'
-                cid = creator_match.group(1)
-                return f"SELECT COUNT(*) FROM videos WHERE creator_id = '{cid}' AND DATE(video_created_at) BETWEEN '{start_date}' AND '{end_date}'"
-
-    views_match = re.search(r'больше\s+(\d[\d\s]*)', user_query, re.IGNORECASE)
-    if creator_match and views_match and 'видео' in q and 'креатор' in q and 'просмотр' in q:
-        if 'итоговой' in q or 'набрали' in q:
-            cid = creator_match.group(1)
-            threshold = int(views_match.group(1).replace(' ', ''))
-            return f"SELECT COUNT(*) FROM videos WHERE creator_id = '{cid}' AND views_count > {threshold}"
-
-    return None
-
-
-def validate_and_fix_sql(sql_query: str, user_query: str) -> str:
-    q = user_query.lower()
-    creator_id_match = re.search(r'id\s+([a-f0-9]{32})', user_query, re.IGNORECASE)
-    views_threshold_match = re.search(r'больше\s+(\d[\d\s]*)', user_query, re.IGNORECASE)
-    is_creator_views_final = (
-        'креатор' in q and 'просмотр' in q
-        and ('итоговой статистике' in q or 'итоговой' in q)
-        and creator_id_match and views_threshold_match
-    )
-    if is_creator_views_final:
-        cid = creator_id_match.group(1)
-        num_str = views_threshold_match.group(1).replace(' ', '')
-        if num_str.isdigit():
-            threshold = int(num_str)
-            if 'video_snapshots' in sql_query.lower():
-                sql_query = f"SELECT COUNT(*) FROM videos WHERE creator_id = '{cid}' AND views_count > {threshold}"
-            elif 'videos' not in sql_query.lower():
-                sql_query = f"SELECT COUNT(*) FROM videos WHERE creator_id = '{cid}' AND views_count > {threshold}"
-
-    if ('замеров' in q or 'замеры' in q) and ('отрицательн' in q or 'уменьшились' in q or 'стало меньше' in q) and 'просмотр' in q:
-        sql_query = "SELECT COUNT(*) FROM video_snapshots WHERE delta_views_count < 0"
-
-    creator_id_patterns = [
-        r'id\s+([a-f0-9]{32})',
-        r'id:\s*([a-f0-9]{32})',
-        r'креатор[а]?\s+с\s+id\s+([a-f0-9]{32})',
-    ]
-    expected_creator_id = None
-    for pattern in creator_id_patterns:
-        match = re.search(pattern, user_query, re.IGNORECASE)
-        if match:
-            expected_creator_id = match.group(1)
-            break
-
-    if expected_creator_id and expected_creator_id not in sql_query:
-        sql_query = re.sub(
-            r"creator_id\s*=\s*'[^']+'",
-            f"creator_id = '{expected_creator_id}'",
-            sql_query,
-            flags=re.IGNORECASE
-        )
+@dp.message(Command('batch'))
+async def batch_handler(message: types.Message, command: CommandObject):
+    questions = [line.strip() for line in (command.args or '').splitlines() if line.strip()]
+    if not questions:
+        await message.answer('После /batch с новой строки перечислите вопросы, по одному на строку')
+        return
+    if len(questions) > batch_max_questions:
+        await message.answer(f'Не больше {batch_max_questions} вопросов за раз')
+        return
+    if rate_limit and not store.allow(f'chat:{message.chat.id}', rate_limit):
+        metrics.inc('rate_limited_total')
+        await message.answer('Слишком много вопросов, подождите минуту')
+        return
 
-    period_patterns = [
-        r'с\s+(\d+)\s+ноября\s+2025\s+по\s+(\d+)\s+ноября\s+2025',
-        r'с\s+(\d+)\s+по\s+(\d+)\s+ноября\s+2025',
-        r'период\s+с\s+(\d+)\s+ноября\s+2025\s+по\s+(\d+)\s+ноября\s+2025',
-    ]
-    start_date = end_date = None
-    for pattern in period_patterns:
-        match = re.search(pattern, user_query, re.IGNORECASE)
-        if match:
-            start_date = f'2025-11-{int(match.group(1)):02d}'
-            end_date = f'2025-11-{int(match.group(2)):02d}'
-            break
-
-    if start_date and end_date and (start_date not in sql_query or end_date not in sql_query):
-        sql_normalized = re.sub(r'\s+', ' ', sql_query)
-        sql_normalized = re.sub(
-            r"BETWEEN\s+'(\d{4}-\d{2}-\d{2})'\s+AND\s+'(\d{4}-\d{2}-\d{2})'",
-            f"BETWEEN '{start_date}' AND '{end_date}'",
-            sql_normalized,
-            flags=re.IGNORECASE
-        )
-        if start_date in sql_normalized and end_date in sql_normalized:
-            sql_query = sql_normalized
-        else:
-            between_pos = sql_query.upper().find('BETWEEN')
-            if between_pos != -1:
-                first_date_match = re.search(r"'(\d{4}-\d{2}-\d{2})'", sql_query[between_pos:])
-                if first_date_match:
-                    sql_query = sql_query.replace(f"'{first_date_match.group(1)}'", f"'{start_date}'", 1)
-                and_pos = sql_query.upper().find('AND', between_pos)
-                if and_pos != -1:
-                    second_date_match = re.search(r"'(\d{4}-\d{2}-\d{2})'", sql_query[and_pos:])
-                    if second_date_match:
-                        sql_query = sql_query.replace(f"'{second_date_match.group(1)}'", f"'{end_date}'", 1)
-            if 'DATE(video_created_at)' not in sql_query and 'video_created_at BETWEEN' in sql_query:
-                sql_query = sql_query.replace('video_created_at BETWEEN', 'DATE(video_created_at) BETWEEN')
-
-    return sql_query
+    try:
+        result = await answer_batch(pipeline, questions)
+    except Exception as e:
+        metrics.inc('failures_total')
+        logger.exception('Ошибка при обработке пакета из %d вопросов', len(questions))
+        await message.answer(error_reply(e))
+        return
+    lines = []
+    for number, (question, answer) in enumerate(zip(questions, result.answers), 1):
+        if isinstance(answer, Exception):
+            if not isinstance(answer, (Busy, QueryRejected)):
+                metrics.inc('failures_total')
+                logger.error('Ошибка при обработке запроса: %r', question, exc_info=answer)
+            answer = error_reply(answer)
+        lines.append(f'{number}. {answer}')
+    grouped = sum(size for _, size in result.groups)
+    lines.append(
+        f'\nОбщих запросов с GROUP BY: {len(result.groups)}, ответили на вопросов: {grouped}; '
+        f'время {result.elapsed:.2f} с, по отдельности ≈ {result.solo_seconds:.2f} с, '
+        f'сэкономлено ≈ {max(result.saved_seconds, 0.0):.2f} с'
+    )
+    with metrics.timer('telegram_send'):
+        await message.answer('\n'.join(lines))
 
 
 @dp.message()
@@ -178,51 +219,125 @@ async def query_handler(message: types.Message):
     user_query = message.text.strip()
     if not user_query:
         return
+    if rate_limit and not store.allow(f'chat:{message.chat.id}', rate_limit):
+        metrics.inc('rate_limited_total')
+        await message.answer('Слишком много вопросов, подождите минуту')
+        return
 
     try:
-        fixed_sql = get_fixed_sql_for_question(user_query)
-        if fixed_sql:
-            sql_query = fixed_sql
-        else:
-            sql_query = await llm.build_query(user_query)
-            sql_query = validate_and_fix_sql(sql_query, user_query)
-
-        if not sql_query.strip().upper().startswith('SELECT'):
-            raise ValueError("Некорректный SQL")
+        answer = await pipeline.answer(user_query)
+        with metrics.timer('telegram_send'):
+            await message.answer(answer)
 
-        result = await db.execute_query(sql_query)
-        answer = '0' if result is None else str(int(result))
-        await message.answer(answer)
-
-    except (ValueError, Exception):
-        await message.answer('Произошла ошибка при обработке запроса')
+    except (Busy, QueryRejected) as e:
+        await message.answer(error_reply(e))
+    except (ValueError, Exception) as e:
+        metrics.inc('failures_total')
+        logger.exception('Ошибка при обработке запроса: %r', user_query)
+        await message.answer(error_reply(e))
 
 
 async def check_ollama():
     import httpx
     try:
-        r = await httpx.AsyncClient(timeout=5).get(f"{ollama_url}/api/tags")
-        return r.status_code == 200
+        async with httpx.AsyncClient(timeout=5) as client:
+            ok = (await client.get(f"{ollama_url}/api/tags")).status_code == 200
     except Exception:
-        return False
+        ok = False
+    if not ok:
+        logger.warning('Ollama недоступна по адресу %s, вопросы без быстрого пути будут завершаться ошибкой', ollama_url)
+    return ok
+
+
+async def startup(index: int = 0):
+    global ollama_check
+    ollama_check = asyncio.ensure_future(check_ollama())
+    await db.connect()
+    if columnar is not None:
+        columnar.schedule_refresh(db)
+    metrics_runner = await metrics.start_server(metrics_host, metrics_port + index) if metrics_port else None
+    return metrics_runner
+
+
+async def shutdown(metrics_runner):
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    await db.close()
+    await llm.close()
+    await bot.session.close()
 
 
 async def main():
-    if not await check_ollama():
-        return
     try:
-        await db.connect()
+        metrics_runner = await startup()
     except Exception:
+        logger.exception('Не удалось подключиться к базе данных')
         return
     try:
         await dp.start_polling(bot)
     finally:
-        await db.close()
-        await llm.close()
+        await shutdown(metrics_runner)
 
 
-if __name__ == '__main__':
+async def serve_webhook(index: int = 0):
+    try:
+        metrics_runner = await startup(index)
+    except Exception:
+        logger.exception('Воркер %d: не удалось подключиться к базе данных', index)
+        return
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=webhook_secret).register(app, path=webhook_path)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, webhook_host, webhook_port, reuse_port=bot_workers > 1).start()
+        logger.info('Воркер %d принимает обновления на %s:%d%s', index, webhook_host, webhook_port, webhook_path)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await shutdown(metrics_runner)
+
+
+def run_worker(index: int):
+    logging.basicConfig(level=logging.INFO)
     try:
-        asyncio.run(main())
+        asyncio.run(serve_webhook(index))
     except KeyboardInterrupt:
         pass
+
+
+async def register_webhook():
+    try:
+        if webhook_url:
+            await bot.set_webhook(webhook_url, secret_token=webhook_secret,
+                                  allowed_updates=dp.resolve_used_update_types())
+    finally:
+        await bot.session.close()
+
+
+def run_webhook():
+    asyncio.run(register_webhook())
+    if bot_workers == 1:
+        run_worker(0)
+        return
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, args=(index,)) for index in range(bot_workers)]
+    for worker in workers:
+        worker.start()
+    signal.signal(signal.SIGTERM, lambda *_: [os.kill(worker.pid, signal.SIGINT) for worker in workers])
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == '__main__':
+    if bot_mode == 'webhook':
+        run_webhook()
+    else:
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
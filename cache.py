@@ -0,0 +1,64 @@
+import re
+import time
+from collections import OrderedDict
+
+SQL_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+WHITESPACE_RE = re.compile(r'\s+')
+
+MISS = object()
+
+
+def normalize_sql(query: str) -> str:
+    parts = SQL_LITERAL_RE.split(query.strip().rstrip(';'))
+    for i in range(0, len(parts), 2):
+        parts[i] = WHITESPACE_RE.sub(' ', parts[i]).lower()
+    return ''.join(parts).strip()
+
+
+def normalize_question(question: str) -> str:
+    return WHITESPACE_RE.sub(' ', question).strip().lower()
+
+
+class ResultCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key, version=None):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return MISS
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += entry[2]
+        return entry[1]
+
+    def set(self, key, value, cost: float = 0.0, version=None):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        self.entries[key] = (time.monotonic() + self.ttl, value, cost)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'saved_seconds': self.saved_seconds,
+        }
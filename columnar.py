@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from datetime import date
+
+import numpy as np
+
+from cache import MISS
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+
+VIDEOS_SQL = (
+    "SELECT creator_id, floor(extract(epoch FROM video_created_at) / 3600)::bigint, views_count FROM videos"
+)
+HOURLY_SQL = (
+    "SELECT creator_id, floor(extract(epoch FROM bucket_hour) / 3600)::bigint, delta_views_count, "
+    "negative_views_count FROM snapshot_rollup_hourly"
+)
+HOURLY_SINCE_SQL = HOURLY_SQL + " WHERE bucket_hour >= to_timestamp($1::bigint * 3600)"
+HOURLY_CHECK_SQL = (
+    "SELECT COUNT(*), COALESCE(SUM(delta_views_count), 0), COALESCE(SUM(negative_views_count), 0) "
+    "FROM snapshot_rollup_hourly WHERE bucket_hour < to_timestamp($1::bigint * 3600)"
+)
+
+
+def day_hour(day: date) -> int:
+    return (day - EPOCH).days * 24
+
+
+def offsets(codes, size: int):
+    return np.searchsorted(codes, np.arange(size + 1))
+
+
+class ColumnStore:
+    def __init__(self):
+        self.creators = []
+        self.codes = {}
+        self.version = None
+        self.watermark = None
+        self.video_creator = np.empty(0, np.int32)
+        self.video_hour = np.empty(0, np.int64)
+        self.video_views = np.empty(0, np.int64)
+        self.video_offsets = np.zeros(1, np.int64)
+        self.creator_max_views = np.empty(0, np.int64)
+        self.hour_creator = np.empty(0, np.int32)
+        self.hour = np.empty(0, np.int64)
+        self.hour_delta_views = np.empty(0, np.int64)
+        self.hour_negative = np.empty(0, np.int64)
+        self.hour_offsets = np.zeros(1, np.int64)
+        self.negative_total = 0
+        self.full_refreshes = 0
+        self.incremental_refreshes = 0
+        self.refresh_seconds = 0.0
+        self.refreshing = None
+        self.kernels = {
+            'creator_views_growth_hours': self.creator_views_growth_hours,
+            'views_sum_published_month': self.views_sum_published_month,
+            'negative_views_snapshots': self.negative_views_snapshots,
+            'creator_publish_days_month': self.creator_publish_days_month,
+            'creators_with_views_over': self.creators_with_views_over,
+            'creator_videos_period': self.creator_videos_period,
+            'creator_videos_views_over': self.creator_videos_views_over,
+        }
+
+    def encode(self, creator_ids):
+        codes = self.codes
+        for creator_id in creator_ids:
+            if creator_id not in codes:
+                codes[creator_id] = len(self.creators)
+                self.creators.append(creator_id)
+        return np.fromiter((codes[creator_id] for creator_id in creator_ids), np.int32, len(creator_ids))
+
+    def columns(self, rows, width: int):
+        return [np.fromiter((row[i] for row in rows), np.int64, len(rows)) for i in range(1, width)]
+
+    def set_videos(self, rows):
+        creator = self.encode([row[0] for row in rows])
+        hour, views = self.columns(rows, 3)
+        order = np.lexsort((hour, creator))
+        self.video_creator, self.video_hour, self.video_views = creator[order], hour[order], views[order]
+        self.video_offsets = offsets(self.video_creator, len(self.creators))
+        starts = self.video_offsets[:-1]
+        present = starts < self.video_offsets[1:]
+        self.creator_max_views = np.full(len(self.creators), -1, np.int64)
+        if len(self.video_views):
+            self.creator_max_views[present] = np.maximum.reduceat(self.video_views, starts[present])
+
+    def set_hours(self, rows, keep=None):
+        creator = self.encode([row[0] for row in rows])
+        hour, delta_views, negative = self.columns(rows, 4)
+        if keep is not None:
+            creator = np.concatenate([self.hour_creator[keep], creator])
+            hour = np.concatenate([self.hour[keep], hour])
+            delta_views = np.concatenate([self.hour_delta_views[keep], delta_views])
+            negative = np.concatenate([self.hour_negative[keep], negative])
+        order = np.lexsort((hour, creator))
+        self.hour_creator, self.hour = creator[order], hour[order]
+        self.hour_delta_views, self.hour_negative = delta_views[order], negative[order]
+        self.hour_offsets = offsets(self.hour_creator, len(self.creators))
+        self.negative_total = int(self.hour_negative.sum())
+        self.watermark = int(self.hour.max()) if len(self.hour) else None
+
+    async def refresh(self, db):
+        started = time.perf_counter()
+        async with db.pool.acquire() as conn:
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                version = await conn.fetchval('SELECT version FROM data_version')
+                videos = await conn.fetch(VIDEOS_SQL)
+                keep = None
+                if self.watermark is not None:
+                    count, delta_views, negative = await conn.fetchrow(HOURLY_CHECK_SQL, self.watermark)
+                    keep = self.hour < self.watermark
+                    if (count, delta_views, negative) != (
+                        int(keep.sum()), int(self.hour_delta_views[keep].sum()), int(self.hour_negative[keep].sum())
+                    ):
+                        keep = None
+                if keep is None:
+                    hours = await conn.fetch(HOURLY_SQL)
+                else:
+                    hours = await conn.fetch(HOURLY_SINCE_SQL, self.watermark)
+        self.set_videos(videos)
+        if keep is None:
+            self.full_refreshes += 1
+            self.set_hours(hours)
+        else:
+            self.incremental_refreshes += 1
+            self.set_hours(hours, keep)
+        self.version = version
+        self.refresh_seconds = time.perf_counter() - started
+
+    def schedule_refresh(self, db):
+        if self.refreshing is None or self.refreshing.done():
+            self.refreshing = asyncio.ensure_future(self.refresh(db))
+            self.refreshing.add_done_callback(self.refreshed)
+        return self.refreshing
+
+    def refreshed(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Не удалось обновить колоночное хранилище: %s', task.exception())
+
+    def answer(self, rule: str, args, version):
+        kernel = self.kernels.get(rule)
+        if kernel is None or version != self.version:
+            return MISS
+        return kernel(*args)
+
+    def video_segment(self, creator_id: str):
+        code = self.codes.get(creator_id)
+        if code is None or code >= len(self.video_offsets) - 1:
+            return slice(0, 0)
+        return slice(self.video_offsets[code], self.video_offsets[code + 1])
+
+    def hour_segment(self, creator_id: str):
+        code = self.codes.get(creator_id)
+        if code is None or code >= len(self.hour_offsets) - 1:
+            return slice(0, 0)
+        return slice(self.hour_offsets[code], self.hour_offsets[code + 1])
+
+    def creator_views_growth_hours(self, creator_id, day, hour_from, hour_to):
+        segment = self.hour_segment(creator_id)
+        hours = self.hour[segment]
+        start = day_hour(day)
+        low = np.searchsorted(hours, start + max(hour_from, 0))
+        high = np.searchsorted(hours, start + min(hour_to, 24))
+        return int(self.hour_delta_views[segment][low:high].sum()) if high > low else 0
+
+    def views_sum_published_month(self, first_day, last_day):
+        mask = (self.video_hour >= day_hour(first_day)) & (self.video_hour < day_hour(last_day) + 24)
+        return int(self.video_views[mask].sum())
+
+    def negative_views_snapshots(self):
+        return self.negative_total
+
+    def creator_publish_days_month(self, creator_id, first_day, next_month):
+        hours = self.video_hour[self.video_segment(creator_id)]
+        low, high = np.searchsorted(hours, [day_hour(first_day), day_hour(next_month)])
+        return int(np.unique(hours[low:high] // 24).size)
+
+    def creators_with_views_over(self, threshold):
+        return int((self.creator_max_views > threshold).sum())
+
+    def creator_videos_period(self, creator_id, first_day, last_day):
+        hours = self.video_hour[self.video_segment(creator_id)]
+        low, high = np.searchsorted(hours, [day_hour(first_day), day_hour(last_day) + 24])
+        return int(high - low)
+
+    def creator_videos_views_over(self, creator_id, threshold):
+        return int((self.video_views[self.video_segment(creator_id)] > threshold).sum())
+
+    def stats(self):
+        arrays = (self.video_creator, self.video_hour, self.video_views, self.hour_creator, self.hour,
+                  self.hour_delta_views, self.hour_negative)
+        return {
+            'version': self.version,
+            'creators': len(self.creators),
+            'videos': len(self.video_views),
+            'hours': len(self.hour),
+            'bytes': sum(array.nbytes for array in arrays),
+            'full_refreshes': self.full_refreshes,
+            'incremental_refreshes': self.incremental_refreshes,
+            'refresh_seconds': self.refresh_seconds,
+        }
@@ -1,21 +1,102 @@
+import json
+import logging
+import time
+
 import asyncpg
 
+from cache import MISS, normalize_sql
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRejected(Exception):
+    def __init__(self, rule: str, detail: str):
+        super().__init__(f'{rule}: {detail}')
+        self.rule = rule
+        self.detail = detail
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
 class Database:
-    def __init__(self, db_url: str):
+    def __init__(self, db_url: str, cache=None, version_check_interval: float = 5.0,
+                 statement_timeout_ms: int = 10000, max_cost: float = 1e6, max_rows: float = 5e7):
         self.db_url = db_url
         self.pool = None
-    
+        self.cache = cache
+        self.version_check_interval = version_check_interval
+        self.statement_timeout_ms = statement_timeout_ms
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self._version = None
+        self._version_checked_at = 0.0
+
     async def connect(self):
-        self.pool = await asyncpg.create_pool(self.db_url, min_size=1, max_size=5)
-    
+        self.pool = await asyncpg.create_pool(
+            self.db_url, min_size=1, max_size=5, server_settings={'timezone': 'UTC'}
+        )
+
     async def close(self):
         if self.pool:
             await self.pool.close()
-    
-    async def execute_query(self, query: str, *args):
-        async with self.pool.acquire() as conn:
+
+    async def data_version(self):
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.version_check_interval:
+            async with self.pool.acquire() as conn:
+                self._version = await conn.fetchval('SELECT version FROM data_version')
+            self._version_checked_at = now
+        return self._version
+
+    async def check_plan(self, conn, query: str, args):
+        plan = json.loads(await conn.fetchval('EXPLAIN (FORMAT JSON) ' + query, *args))[0]['Plan']
+        cost = plan['Total Cost']
+        rows = max(node['Plan Rows'] for node in plan_nodes(plan))
+        if self.max_cost and cost > self.max_cost:
+            self.reject('cost', f'оценка {cost:.0f} > {self.max_cost:.0f}', query)
+        if self.max_rows and rows > self.max_rows:
+            self.reject('rows', f'оценка {rows:.0f} строк > {self.max_rows:.0f}', query)
+
+    def reject(self, rule: str, detail: str, query: str):
+        metrics.inc('query_guard_total', rule=rule)
+        logger.warning('Запрос отклонён правилом %s (%s): %s', rule, detail, query)
+        raise QueryRejected(rule, detail)
+
+    async def fetch_guarded(self, conn, query: str, args, rows: bool = False):
+        async with conn.transaction(readonly=True):
+            if self.statement_timeout_ms:
+                await conn.execute(f'SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}')
+            if self.max_cost or self.max_rows:
+                await self.check_plan(conn, query, args)
             try:
-                result = await conn.fetchval(query, *args)
+                return await (conn.fetch if rows else conn.fetchval)(query, *args)
+            except asyncpg.QueryCanceledError:
+                self.reject('timeout', f'дольше {self.statement_timeout_ms} мс', query)
+
+    async def execute_query(self, query: str, *args, guarded: bool = False, rows: bool = False):
+        if self.cache is not None:
+            version = await self.data_version()
+            key = (normalize_sql(query), args, rows)
+            result = self.cache.get(key, version)
+            if result is not MISS:
+                metrics.inc('sql_cache_total', result='hit')
                 return result
-            except Exception:
-                raise
+            metrics.inc('sql_cache_total', result='miss')
+            started = time.perf_counter()
+
+        acquire_started = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            metrics.observe('db_pool_wait_seconds', time.perf_counter() - acquire_started)
+            if guarded:
+                result = await self.fetch_guarded(conn, query, args, rows)
+            else:
+                result = await (conn.fetch if rows else conn.fetchval)(query, *args)
+
+        if self.cache is not None:
+            self.cache.set(key, result, time.perf_counter() - started, version)
+        return result
@@ -1,5 +1,12 @@
+import asyncio
+import json
+import re
+import time
+
 import httpx
 
+from sql_rules import KNOWN_IDENTIFIERS, sql_problems
+
 SCHEMA_DESCRIPTION = """
 # Схема данных: видео и аналитика
 
@@ -78,13 +85,9 @@ PostgreSQL. Две таблицы с разной семантикой — от
 Все значения (ID креатора, даты, числа, часы) бери только из текущего вопроса пользователя, не из примеров.
 """
 
-PROMPT_TEMPLATE = f"""{SCHEMA_DESCRIPTION}
-
----
-
-Вопрос пользователя: "{{user_query}}"
+SYSTEM_MESSAGE = "Ты эксперт по SQL и PostgreSQL. По описанию схемы и правилам определи, из каких таблиц что брать и как считать. Преобразуй вопрос на русском в один SQL-запрос, возвращающий одно число."
 
-Задание:
+TASK_DESCRIPTION = """Задание для каждого вопроса пользователя:
 1. Извлеки из вопроса все нужные значения: ID креатора (после «id » или «id»), даты (переведи «N ноября 2025» в '2025-11-N'), числа (порог просмотров и т.д.), часы (если указаны). Используй только эти значения, не подставляй примеры из описания схемы.
 2. По смыслу вопроса выбери таблицу(ы) и агрегат по правилам из раздела «Как выбрать таблицу и что считать».
 3. Напиши один SQL-запрос для PostgreSQL, который возвращает одно число (скаляр).
@@ -92,49 +95,284 @@ PROMPT_TEMPLATE = f"""{SCHEMA_DESCRIPTION}
 Формат ответа: только SQL, без markdown (без ```sql), без пояснений до или после. Запрос должен начинаться с SELECT.
 """
 
+USER_PROMPT_TEMPLATE = 'Вопрос пользователя: "{user_query}"'
+
+SNAPSHOT_ONLY_MARKERS = ("video_snapshots", "delta_", "Дата замера", "Часы в течение дня")
+SNAPSHOT_KEYWORDS = ("прирост", "вырос", "выросл", "замер", "снапшот", "за час", "по часам", "отрицательн", " до ")
+
+
+def split_schema(schema: str):
+    base, snapshots = [], []
+    for section in schema.split("\n---\n"):
+        if section.lstrip().startswith("## 2."):
+            snapshots.append(section.strip("\n"))
+            continue
+        lines = section.split("\n")
+        base.append("\n".join(line for line in lines if not any(marker in line for marker in SNAPSHOT_ONLY_MARKERS)))
+        extra = [line for line in lines if any(marker in line for marker in SNAPSHOT_ONLY_MARKERS)]
+        if extra:
+            title = next(line for line in lines if line.startswith("## "))
+            snapshots.append(f"{title}: замеры\n\n" + "\n".join(extra))
+    return "\n---\n".join(base), "\n\n".join(snapshots)
+
+
+VIDEOS_SCHEMA, _ = split_schema(SCHEMA_DESCRIPTION)
+
+SYSTEM_PROMPTS = {
+    "videos": f"{SYSTEM_MESSAGE}\n\n{VIDEOS_SCHEMA}\n---\n\n{TASK_DESCRIPTION}",
+    "full": f"{SYSTEM_MESSAGE}\n\n{SCHEMA_DESCRIPTION}\n---\n\n{TASK_DESCRIPTION}",
+}
+
+
+def schema_variant(user_query: str) -> str:
+    q = user_query.lower()
+    return "full" if any(keyword in q for keyword in SNAPSHOT_KEYWORDS) else "videos"
+
+
+SELECT_RE = re.compile(r"\bSELECT\b", re.IGNORECASE)
+NEXT_WORD_RE = re.compile(r"\s*(?:\w+\.)?([^\W\d]\w*)?")
+
+
+class SQLStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.start = None
+        self.pos = 0
+        self.quote = None
+        self.depth = 0
+        self.sql = None
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        if self.start is None:
+            m = SELECT_RE.search(self.text)
+            if not m:
+                return None
+            self.start = self.pos = m.start()
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if self.quote:
+                if ch == self.quote:
+                    if text[self.pos + 1:self.pos + 2] == self.quote:
+                        self.pos += 1
+                    elif self.pos + 1 == len(text):
+                        return None
+                    else:
+                        self.quote = None
+            elif ch in "'\"":
+                self.quote = ch
+            elif ch == "(":
+                self.depth += 1
+            elif ch == ")":
+                self.depth -= 1
+            elif ch == ";" and self.depth <= 0:
+                return self.finish(self.pos)
+            elif ch == "`":
+                if len(text) - self.pos < 3:
+                    return None
+                if text.startswith("```", self.pos):
+                    return self.finish(self.pos)
+            elif ch == "\n" and self.depth <= 0:
+                if self.pos + 1 == len(text):
+                    return None
+                if text[self.pos + 1] == "\n":
+                    m = NEXT_WORD_RE.match(text, self.pos)
+                    if m.end() == len(text):
+                        return None
+                    if m.group(1) and m.group(1).lower() not in KNOWN_IDENTIFIERS:
+                        return self.finish(self.pos)
+            self.pos += 1
+        return None
+
+    def finish(self, end: int = None):
+        if self.sql is None and self.start is not None:
+            self.sql = self.text[self.start:end].strip().rstrip(";").strip()
+        return self.sql
+
+
+def extract_sql(text: str) -> str:
+    parser = SQLStreamParser()
+    return parser.feed(text) or parser.finish() or strip_fences(text)
+
+
+def strip_fences(sql_query: str) -> str:
+    sql_query = sql_query.strip()
+    if sql_query.startswith("```sql"):
+        sql_query = sql_query[6:]
+    if sql_query.startswith("```"):
+        sql_query = sql_query[3:]
+    if sql_query.endswith("```"):
+        sql_query = sql_query[:-3]
+    return sql_query.strip()
+
 
 class LLMQueryBuilder:
-    def __init__(self, ollama_url: str = "http://localhost:11434", model: str = "llama3.2"):
+    def __init__(self, ollama_url: str = "http://localhost:11434", model: str = "llama3.2", stream: bool = False,
+                 keep_alive: str = "30m", compact_schema: bool = False, fast_model: str = None,
+                 speculative: bool = False, parallel: int = 1, check=sql_problems):
         self.ollama_url = ollama_url
         self.model = model
+        self.models = [fast_model, model] if fast_model and fast_model != model else [model]
+        self.stream = stream
+        self.keep_alive = keep_alive
+        self.compact_schema = compact_schema
+        self.speculative = speculative
+        self.parallel = parallel
+        self.check = check
+        self.active = 0
         self.client = httpx.AsyncClient(timeout=60.0)
+        self.last_stats = {}
+        self.timings = {
+            "calls": 0,
+            "eval_calls": 0,
+            "stream_calls": 0,
+            "prompt_eval_count": 0,
+            "prompt_eval_seconds": 0.0,
+            "eval_count": 0,
+            "eval_seconds": 0.0,
+            "first_chunk_seconds": 0.0,
+        }
+        self.tiers = {
+            name: {"calls": 0, "accepted": 0, "rejected": 0, "failed": 0, "cancelled": 0, "seconds": 0.0}
+            for name in self.models
+        }
+
+    def payload(self, user_query: str, stream: bool, model: str = None):
+        variant = schema_variant(user_query) if self.compact_schema else "full"
+        return {
+            "model": model or self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPTS[variant]},
+                {"role": "user", "content": USER_PROMPT_TEMPLATE.format(user_query=user_query)},
+            ],
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": 0.1,
+                "num_predict": 500,
+            },
+        }
+
+    def record(self, stats, data):
+        if "prompt_eval_duration" in data:
+            self.timings["eval_calls"] += 1
+        for key in ("prompt_eval_count", "eval_count"):
+            if key in data:
+                stats[key] = data[key]
+                self.timings[key] += data[key]
+        for key in ("prompt_eval", "eval"):
+            if f"{key}_duration" in data:
+                seconds = data[f"{key}_duration"] / 1e9
+                stats[f"{key}_seconds"] = seconds
+                self.timings[f"{key}_seconds"] += seconds
+
+    def account(self, attempts, model: str, result: str, seconds: float, problems=()):
+        tier = self.tiers[model]
+        tier["calls"] += 1
+        tier[result] += 1
+        tier["seconds"] += seconds
+        attempts.append({"model": model, "result": result, "seconds": seconds, "problems": list(problems)})
 
     async def build_query(self, user_query: str) -> str:
-        prompt = PROMPT_TEMPLATE.format(user_query=user_query)
-
+        started = time.perf_counter()
+        attempts = []
+        if len(self.models) > 1 and self.speculative and self.active + len(self.models) <= self.parallel:
+            sql_query, stats = await self.speculate(user_query, attempts)
+        else:
+            sql_query, stats = await self.cascade(user_query, attempts)
+        stats.update(seconds=time.perf_counter() - started, attempts=attempts)
+        self.last_stats = stats
+        return sql_query
+
+    async def cascade(self, user_query: str, attempts):
+        for model in self.models:
+            last = model == self.models[-1]
+            try:
+                sql_query, stats = await self.generate(model, user_query)
+            except Exception:
+                self.account(attempts, model, "failed", 0.0)
+                if last:
+                    raise
+                continue
+            problems = self.check(sql_query, user_query) if len(self.models) > 1 else []
+            self.account(attempts, model, "rejected" if problems else "accepted", stats["seconds"], problems)
+            if not problems or last:
+                return sql_query, stats
+
+    async def speculate(self, user_query: str, attempts):
+        tasks = {model: asyncio.ensure_future(self.generate(model, user_query)) for model in self.models}
         try:
-            response = await self.client.post(
-                f"{self.ollama_url}/api/chat",
-                json={
-                    "model": self.model,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "Ты эксперт по SQL и PostgreSQL. По описанию схемы и правилам определи, из каких таблиц что брать и как считать. Преобразуй вопрос на русском в один SQL-запрос, возвращающий одно число.",
-                        },
-                        {"role": "user", "content": prompt},
-                    ],
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.1,
-                        "num_predict": 500,
-                    },
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
-            sql_query = data["message"]["content"].strip()
+            for model, task in tasks.items():
+                last = model == self.models[-1]
+                try:
+                    sql_query, stats = await task
+                except Exception:
+                    self.account(attempts, model, "failed", 0.0)
+                    if last:
+                        raise
+                    continue
+                problems = self.check(sql_query, user_query)
+                self.account(attempts, model, "rejected" if problems else "accepted", stats["seconds"], problems)
+                if not problems or last:
+                    return sql_query, stats
+        finally:
+            for model, task in tasks.items():
+                if not task.done():
+                    task.cancel()
+                    self.account(attempts, model, "cancelled", 0.0)
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    async def generate(self, model: str, user_query: str):
+        started = time.perf_counter()
+        stats = {"model": model}
+        self.active += 1
+        try:
+            if self.stream:
+                sql_query, chunks, early = await self.stream_query(user_query, stats, started, model)
+            else:
+                response = await self.client.post(
+                    f"{self.ollama_url}/api/chat", json=self.payload(user_query, False, model)
+                )
+                response.raise_for_status()
+                data = response.json()
+                self.record(stats, data)
+                sql_query, chunks, early = extract_sql(data["message"]["content"]), None, False
         except Exception as e:
             raise Exception(f"Ошибка при запросе к Ollama: {e}")
-
-        if sql_query.startswith("```sql"):
-            sql_query = sql_query[6:]
-        if sql_query.startswith("```"):
-            sql_query = sql_query[3:]
-        if sql_query.endswith("```"):
-            sql_query = sql_query[:-3]
-
-        return sql_query.strip()
+        finally:
+            self.active -= 1
+
+        stats.update(seconds=time.perf_counter() - started, chunks=chunks, stopped_early=early)
+        self.timings["calls"] += 1
+        return sql_query, stats
+
+    async def stream_query(self, user_query: str, stats, started: float, model: str = None):
+        parser = SQLStreamParser()
+        chunks = 0
+        async with self.client.stream(
+            "POST", f"{self.ollama_url}/api/chat", json=self.payload(user_query, True, model)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise Exception(data["error"])
+                chunks += 1
+                if chunks == 1:
+                    stats["first_chunk_seconds"] = time.perf_counter() - started
+                    self.timings["stream_calls"] += 1
+                    self.timings["first_chunk_seconds"] += stats["first_chunk_seconds"]
+                if data.get("done"):
+                    self.record(stats, data)
+                sql_query = parser.feed(data.get("message", {}).get("content", ""))
+                if sql_query:
+                    return sql_query, chunks, not data.get("done")
+                if data.get("done"):
+                    break
+        return parser.finish() or strip_fences(parser.text), chunks, False
 
     async def close(self):
         await self.client.aclose()
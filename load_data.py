@@ -1,10 +1,17 @@
+import argparse
 import asyncio
 import json
+import os
+import re
+import time
+import uuid
 import asyncpg
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from os import getenv
 from dotenv import load_dotenv
 
+from partitions import ensure_partitions
+
 load_dotenv()
 
 def parse_datetime(date_str):
@@ -20,6 +27,12 @@ async def load_json_to_db(json_path: str, db_url: str):
             data = json.load(f)
         
         videos = data.get('videos', [])
+        loaded_range = None
+        for video in videos:
+            loaded_range = snapshot_range([snapshot_record(s, video['id']) for s in video.get('snapshots', [])],
+                                          loaded_range)
+        if loaded_range:
+            await ensure_partitions(conn, *loaded_range, ahead=1)
         
         for idx, video in enumerate(videos):
             video_id = video['id']
@@ -34,7 +47,8 @@ async def load_json_to_db(json_path: str, db_url: str):
                     comments_count = EXCLUDED.comments_count,
                     reports_count = EXCLUDED.reports_count,
                     updated_at = EXCLUDED.updated_at
-            """, video_id, video['creator_id'], parse_datetime(video['video_created_at']),
+                WHERE {VIDEO_CHANGED}
+            """.format(VIDEO_CHANGED=VIDEO_CHANGED), video_id, video['creator_id'], parse_datetime(video['video_created_at']),
                 video['views_count'], video['likes_count'], 
                 video['comments_count'], video['reports_count'],
                 parse_datetime(video['created_at']), parse_datetime(video['updated_at']))
@@ -47,7 +61,7 @@ async def load_json_to_db(json_path: str, db_url: str):
                      reports_count, delta_views_count, delta_likes_count, 
                      delta_comments_count, delta_reports_count, created_at, updated_at)
                     VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                    ON CONFLICT (id) DO UPDATE SET
+                    ON CONFLICT ON CONSTRAINT video_snapshots_pkey DO UPDATE SET
                         views_count = EXCLUDED.views_count,
                         likes_count = EXCLUDED.likes_count,
                         comments_count = EXCLUDED.comments_count,
@@ -57,7 +71,8 @@ async def load_json_to_db(json_path: str, db_url: str):
                         delta_comments_count = EXCLUDED.delta_comments_count,
                         delta_reports_count = EXCLUDED.delta_reports_count,
                         updated_at = EXCLUDED.updated_at
-                """, snapshot['id'], video_id, snapshot['views_count'],
+                    WHERE {SNAPSHOT_CHANGED}
+                """.format(SNAPSHOT_CHANGED=SNAPSHOT_CHANGED), snapshot['id'], video_id, snapshot['views_count'],
                     snapshot['likes_count'], snapshot['comments_count'],
                     snapshot['reports_count'], snapshot['delta_views_count'],
                     snapshot['delta_likes_count'], snapshot['delta_comments_count'],
@@ -79,16 +94,493 @@ async def load_json_to_db(json_path: str, db_url: str):
                     LIMIT 1
                 ) s
                 WHERE id = $1
+                  AND (videos.views_count, videos.likes_count, videos.comments_count, videos.reports_count)
+                      IS DISTINCT FROM (s.views_count, s.likes_count, s.comments_count, s.reports_count)
             """, video_id)
+            await conn.execute(WATERMARK_VIDEO_SQL, video_id)
+        await refresh_rollups(conn, loaded_range)
+        await bump_data_version(conn)
         print(len(videos))
 
     finally:
         await conn.close()
 
+VIDEOS_ARRAY_RE = re.compile(r'"videos"\s*:\s*\[')
+
+VIDEO_COLUMNS = [
+    'id', 'creator_id', 'video_created_at', 'views_count', 'likes_count',
+    'comments_count', 'reports_count', 'created_at', 'updated_at',
+]
+SNAPSHOT_COLUMNS = [
+    'id', 'video_id', 'views_count', 'likes_count', 'comments_count',
+    'reports_count', 'delta_views_count', 'delta_likes_count',
+    'delta_comments_count', 'delta_reports_count', 'created_at', 'updated_at',
+]
+
+
+def iter_videos(json_path: str, chunk_size: int = 1 << 20):
+    decoder = json.JSONDecoder()
+    with open(json_path, 'r', encoding='utf-8') as f:
+        buf = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+            m = VIDEOS_ARRAY_RE.search(buf)
+            if m:
+                buf = buf[m.end():]
+                break
+            buf = buf[-64:]
+
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                buf, pos = chunk, 0
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                video, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(max(chunk_size, len(buf) - pos))
+                if not chunk:
+                    raise
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield video
+            pos = end
+            if pos >= chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+def video_record(video):
+    return (
+        video['id'], video['creator_id'], parse_datetime(video['video_created_at']),
+        video['views_count'], video['likes_count'], video['comments_count'],
+        video['reports_count'], parse_datetime(video['created_at']),
+        parse_datetime(video['updated_at']),
+    )
+
+
+def new_records(video, watermarks=None):
+    snapshot_rows = [snapshot_record(snapshot, video['id']) for snapshot in video.get('snapshots', [])]
+    if watermarks is not None:
+        watermark = watermarks.get(str(uuid.UUID(video['id'])))
+        if watermark is not None:
+            snapshot_rows = [row for row in snapshot_rows if row[10] > watermark]
+            if not snapshot_rows:
+                return None, snapshot_rows
+    return video_record(video), snapshot_rows
+
+
+def snapshot_record(snapshot, video_id):
+    return (
+        snapshot['id'], video_id, snapshot['views_count'], snapshot['likes_count'],
+        snapshot['comments_count'], snapshot['reports_count'],
+        snapshot['delta_views_count'], snapshot['delta_likes_count'],
+        snapshot['delta_comments_count'], snapshot['delta_reports_count'],
+        parse_datetime(snapshot['created_at']), parse_datetime(snapshot['updated_at']),
+    )
+
+
+VIDEO_CHANGED = """(videos.views_count, videos.likes_count, videos.comments_count, videos.reports_count)
+                    IS DISTINCT FROM
+                    (EXCLUDED.views_count, EXCLUDED.likes_count, EXCLUDED.comments_count, EXCLUDED.reports_count)
+                    AND NOT EXISTS (SELECT 1 FROM video_snapshots vs WHERE vs.video_id = videos.id)"""
+SNAPSHOT_CHANGED = """(video_snapshots.views_count, video_snapshots.likes_count, video_snapshots.comments_count,
+                     video_snapshots.reports_count, video_snapshots.delta_views_count,
+                     video_snapshots.delta_likes_count, video_snapshots.delta_comments_count,
+                     video_snapshots.delta_reports_count)
+                    IS DISTINCT FROM
+                    (EXCLUDED.views_count, EXCLUDED.likes_count, EXCLUDED.comments_count,
+                     EXCLUDED.reports_count, EXCLUDED.delta_views_count, EXCLUDED.delta_likes_count,
+                     EXCLUDED.delta_comments_count, EXCLUDED.delta_reports_count)"""
+
+WATERMARK_UPSERT = """
+    ON CONFLICT (video_id) DO UPDATE SET last_snapshot_at = EXCLUDED.last_snapshot_at
+    WHERE EXCLUDED.last_snapshot_at > ingest_watermarks.last_snapshot_at
+"""
+WATERMARK_VIDEO_SQL = """
+    INSERT INTO ingest_watermarks (video_id, last_snapshot_at)
+    SELECT video_id, MAX(created_at) FROM video_snapshots WHERE video_id = $1 GROUP BY video_id
+""" + WATERMARK_UPSERT
+WATERMARK_STAGE_SQL = """
+    INSERT INTO ingest_watermarks (video_id, last_snapshot_at)
+    SELECT video_id, MAX(created_at) FROM stage_snapshots GROUP BY video_id
+""" + WATERMARK_UPSERT
+
+ROLLUP_HOURLY_SQL = """
+    INSERT INTO snapshot_rollup_hourly
+    SELECT v.creator_id,
+           date_trunc('hour', vs.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           COUNT(*),
+           COUNT(*) FILTER (WHERE vs.delta_views_count < 0),
+           SUM(vs.delta_views_count),
+           SUM(vs.delta_likes_count),
+           SUM(vs.delta_comments_count),
+           SUM(vs.delta_reports_count)
+    FROM video_snapshots vs
+    JOIN videos v ON v.id = vs.video_id
+    WHERE vs.created_at >= $1 AND vs.created_at < $2
+    GROUP BY 1, 2
+"""
+
+ROLLUP_DAILY_SQL = """
+    INSERT INTO snapshot_rollup_daily
+    SELECT creator_id,
+           (bucket_hour AT TIME ZONE 'UTC')::date,
+           SUM(snapshots_count),
+           SUM(negative_views_count),
+           SUM(delta_views_count),
+           SUM(delta_likes_count),
+           SUM(delta_comments_count),
+           SUM(delta_reports_count)
+    FROM snapshot_rollup_hourly
+    WHERE bucket_hour >= $1 AND bucket_hour < $2
+    GROUP BY 1, 2
+"""
+
+
+def snapshot_range(snapshot_rows, current=None):
+    if not snapshot_rows:
+        return current
+    lo = min(row[10] for row in snapshot_rows)
+    hi = max(row[10] for row in snapshot_rows)
+    if current:
+        lo, hi = min(lo, current[0]), max(hi, current[1])
+    return lo, hi
+
+
+async def refresh_rollups(conn, loaded_range):
+    if not loaded_range:
+        return
+    utc_lo, utc_hi = (ts.astimezone(timezone.utc) for ts in loaded_range)
+    hour_lo = utc_lo.replace(minute=0, second=0, microsecond=0)
+    hour_hi = utc_hi.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    day_lo = hour_lo.replace(hour=0)
+    day_hi = hour_hi.replace(hour=0) + timedelta(days=1) if hour_hi.hour else hour_hi
+    async with conn.transaction():
+        await conn.execute('DELETE FROM snapshot_rollup_hourly WHERE bucket_hour >= $1 AND bucket_hour < $2',
+                           hour_lo, hour_hi)
+        await conn.execute(ROLLUP_HOURLY_SQL, hour_lo, hour_hi)
+        await conn.execute('DELETE FROM snapshot_rollup_daily WHERE bucket_date >= $1 AND bucket_date < $2',
+                           day_lo.date(), day_hi.date())
+        await conn.execute(ROLLUP_DAILY_SQL, day_lo, day_hi)
+
+
+async def bump_data_version(conn):
+    await conn.execute('UPDATE data_version SET version = version + 1, updated_at = NOW()')
+
+
+async def create_staging_tables(conn):
+    await conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS stage_videos (LIKE videos) ON COMMIT DELETE ROWS;
+        CREATE TEMP TABLE IF NOT EXISTS stage_snapshots (LIKE video_snapshots) ON COMMIT DELETE ROWS;
+        CREATE TEMP TABLE IF NOT EXISTS stage_changed_ids (id UUID PRIMARY KEY) ON COMMIT DELETE ROWS;
+        CREATE TEMP TABLE IF NOT EXISTS stage_loaded_ids (id UUID PRIMARY KEY);
+    """)
+
+
+async def read_watermarks(conn):
+    rows = await conn.fetch('SELECT video_id, last_snapshot_at FROM ingest_watermarks')
+    return {str(row['video_id']): row['last_snapshot_at'] for row in rows}
+
+
+async def merge_batch(conn, video_rows, snapshot_rows, refresh_stats=False):
+    batch_range = snapshot_range(snapshot_rows)
+    if batch_range:
+        await ensure_partitions(conn, *batch_range, ahead=1)
+    async with conn.transaction():
+        await conn.copy_records_to_table('stage_videos', records=video_rows, columns=VIDEO_COLUMNS)
+        if snapshot_rows:
+            await conn.copy_records_to_table('stage_snapshots', records=snapshot_rows, columns=SNAPSHOT_COLUMNS)
+        await conn.execute("""
+            INSERT INTO videos (id, creator_id, video_created_at, views_count,
+                                likes_count, comments_count, reports_count,
+                                created_at, updated_at)
+            SELECT DISTINCT ON (sv.id) sv.id, sv.creator_id, sv.video_created_at,
+                   COALESCE(s.views_count, sv.views_count), COALESCE(s.likes_count, sv.likes_count),
+                   COALESCE(s.comments_count, sv.comments_count), COALESCE(s.reports_count, sv.reports_count),
+                   sv.created_at, sv.updated_at
+            FROM stage_videos sv
+            LEFT JOIN LATERAL (
+                SELECT ss.views_count, ss.likes_count, ss.comments_count, ss.reports_count
+                FROM stage_snapshots ss
+                WHERE ss.video_id = sv.id
+                ORDER BY ss.created_at DESC, ss.updated_at DESC
+                LIMIT 1
+            ) s ON true
+            ORDER BY sv.id, sv.updated_at DESC
+            ON CONFLICT (id) DO UPDATE SET
+                views_count = EXCLUDED.views_count,
+                likes_count = EXCLUDED.likes_count,
+                comments_count = EXCLUDED.comments_count,
+                reports_count = EXCLUDED.reports_count,
+                updated_at = EXCLUDED.updated_at
+            WHERE {VIDEO_CHANGED}
+              AND NOT EXISTS (SELECT 1 FROM stage_snapshots ss WHERE ss.video_id = videos.id)
+        """.format(VIDEO_CHANGED=VIDEO_CHANGED))
+        await conn.execute("""
+            WITH changed AS (
+                INSERT INTO video_snapshots
+                (id, video_id, views_count, likes_count, comments_count,
+                 reports_count, delta_views_count, delta_likes_count,
+                 delta_comments_count, delta_reports_count, created_at, updated_at)
+                SELECT DISTINCT ON (id) id, video_id, views_count, likes_count, comments_count,
+                       reports_count, delta_views_count, delta_likes_count,
+                       delta_comments_count, delta_reports_count, created_at, updated_at
+                FROM stage_snapshots
+                ORDER BY id, updated_at DESC
+                ON CONFLICT ON CONSTRAINT video_snapshots_pkey DO UPDATE SET
+                    views_count = EXCLUDED.views_count,
+                    likes_count = EXCLUDED.likes_count,
+                    comments_count = EXCLUDED.comments_count,
+                    reports_count = EXCLUDED.reports_count,
+                    delta_views_count = EXCLUDED.delta_views_count,
+                    delta_likes_count = EXCLUDED.delta_likes_count,
+                    delta_comments_count = EXCLUDED.delta_comments_count,
+                    delta_reports_count = EXCLUDED.delta_reports_count,
+                    updated_at = EXCLUDED.updated_at
+                WHERE {SNAPSHOT_CHANGED}
+                RETURNING video_id
+            )
+            INSERT INTO stage_changed_ids SELECT DISTINCT video_id FROM changed
+            ON CONFLICT DO NOTHING
+        """.format(SNAPSHOT_CHANGED=SNAPSHOT_CHANGED))
+        await conn.execute(WATERMARK_STAGE_SQL)
+        if refresh_stats:
+            await conn.execute(FINAL_STATS_SQL.format(video_ids='SELECT id FROM stage_changed_ids'))
+        else:
+            await conn.execute("""
+                INSERT INTO stage_loaded_ids SELECT id FROM stage_changed_ids
+                ON CONFLICT DO NOTHING
+            """)
+
+
+FINAL_STATS_SQL = """
+    UPDATE videos v SET
+        views_count = s.views_count,
+        likes_count = s.likes_count,
+        comments_count = s.comments_count,
+        reports_count = s.reports_count,
+        updated_at = NOW()
+    FROM ({video_ids}) ids(id)
+    CROSS JOIN LATERAL (
+        SELECT vs.views_count, vs.likes_count, vs.comments_count, vs.reports_count
+        FROM video_snapshots vs
+        WHERE vs.video_id = ids.id
+        ORDER BY vs.created_at DESC
+        LIMIT 1
+    ) s
+    WHERE v.id = ids.id
+      AND (v.views_count, v.likes_count, v.comments_count, v.reports_count)
+          IS DISTINCT FROM (s.views_count, s.likes_count, s.comments_count, s.reports_count)
+"""
+
+
+async def refresh_final_stats(conn):
+    await conn.execute(FINAL_STATS_SQL.format(video_ids='SELECT id FROM stage_loaded_ids'))
+
+
+async def bulk_load_json_to_db(json_path: str, db_url: str, batch_size: int = 50000, incremental: bool = False):
+    conn = await asyncpg.connect(db_url)
+
+    try:
+        await create_staging_tables(conn)
+        watermarks = await read_watermarks(conn) if incremental else None
+        started = time.perf_counter()
+        total_videos = total_snapshots = skipped = 0
+        video_rows, snapshot_rows = [], []
+        loaded_range = None
+
+        async def flush():
+            nonlocal total_videos, total_snapshots, loaded_range
+            await merge_batch(conn, video_rows, snapshot_rows)
+            loaded_range = snapshot_range(snapshot_rows, loaded_range)
+            total_videos += len(video_rows)
+            total_snapshots += len(snapshot_rows)
+            elapsed = time.perf_counter() - started
+            print(f'{total_videos} videos, {total_snapshots} snapshots, '
+                  f'{(total_videos + total_snapshots) / elapsed:.0f} rows/sec')
+            video_rows.clear()
+            snapshot_rows.clear()
+
+        for video in iter_videos(json_path):
+            video_row, new_snapshots = new_records(video, watermarks)
+            if video_row is None:
+                skipped += 1
+                continue
+            video_rows.append(video_row)
+            snapshot_rows.extend(new_snapshots)
+            if len(video_rows) + len(snapshot_rows) >= batch_size:
+                await flush()
+        if video_rows:
+            await flush()
+        if incremental:
+            print(f'{skipped} videos without new snapshots skipped')
+            if not total_videos:
+                return
+
+        await refresh_final_stats(conn)
+        await refresh_rollups(conn, loaded_range)
+        await bump_data_version(conn)
+        elapsed = time.perf_counter() - started
+        print(f'loaded {total_videos} videos, {total_snapshots} snapshots in {elapsed:.1f}s '
+              f'({(total_videos + total_snapshots) / elapsed:.0f} rows/sec)')
+
+    finally:
+        await conn.close()
+
+
+def shard_of(video_id: str, workers: int) -> int:
+    return uuid.UUID(video_id).int % workers
+
+
+def read_checkpoint(checkpoint_path: str, json_path: str, workers: int):
+    source = {'json_path': os.path.abspath(json_path), 'size': os.path.getsize(json_path), 'workers': workers}
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        checkpoint = None
+    if not checkpoint or checkpoint.get('source') != source:
+        if checkpoint:
+            print(f'checkpoint {checkpoint_path} does not match input, starting from scratch')
+        checkpoint = {'source': source, 'shards': {}}
+    checkpoint['shards'] = {int(k): v for k, v in checkpoint['shards'].items()}
+    return checkpoint
+
+
+def write_checkpoint(checkpoint_path: str, checkpoint):
+    tmp_path = f'{checkpoint_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+async def parallel_load_json_to_db(json_path: str, db_url: str, workers: int = 4,
+                                   batch_size: int = 50000, checkpoint_path: str = None,
+                                   retries: int = 3, incremental: bool = False):
+    checkpoint_path = checkpoint_path or f'{json_path}.checkpoint'
+    checkpoint = read_checkpoint(checkpoint_path, json_path, workers)
+    done = checkpoint['shards']
+    pool = await asyncpg.create_pool(db_url, min_size=workers, max_size=workers, init=create_staging_tables)
+
+    try:
+        if incremental:
+            async with pool.acquire() as conn:
+                watermarks = await read_watermarks(conn)
+        else:
+            watermarks = None
+        started = time.perf_counter()
+        queues = [asyncio.Queue(maxsize=2) for _ in range(workers)]
+        totals = {'videos': 0, 'snapshots': 0}
+
+        def checkpoint_range():
+            if 'range' in checkpoint:
+                return tuple(datetime.fromisoformat(ts) for ts in checkpoint['range'])
+            return None
+
+        async def worker(shard):
+            while True:
+                batch = await queues[shard].get()
+                if batch is None:
+                    return
+                video_rows, snapshot_rows = batch
+                for attempt in range(1, retries + 1):
+                    try:
+                        async with pool.acquire() as conn:
+                            await merge_batch(conn, video_rows, snapshot_rows, refresh_stats=True)
+                        break
+                    except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+                        if attempt == retries:
+                            raise
+                        print(f'shard {shard}: batch failed ({e}), retry {attempt}/{retries - 1}')
+                        await asyncio.sleep(2 ** attempt)
+                done[shard] = done.get(shard, 0) + len(video_rows)
+                loaded_range = snapshot_range(snapshot_rows, checkpoint_range())
+                if loaded_range:
+                    checkpoint['range'] = [ts.isoformat() for ts in loaded_range]
+                write_checkpoint(checkpoint_path, checkpoint)
+                totals['videos'] += len(video_rows)
+                totals['snapshots'] += len(snapshot_rows)
+                elapsed = time.perf_counter() - started
+                print(f'shard {shard}: {done[shard]} videos; total {totals["videos"]} videos, '
+                      f'{totals["snapshots"]} snapshots, '
+                      f'{(totals["videos"] + totals["snapshots"]) / elapsed:.0f} rows/sec')
+
+        async def reader():
+            seen = [0] * workers
+            buffers = [([], []) for _ in range(workers)]
+            for video in iter_videos(json_path):
+                shard = shard_of(video['id'], workers)
+                seen[shard] += 1
+                if seen[shard] <= done.get(shard, 0):
+                    continue
+                video_row, new_snapshots = new_records(video, watermarks)
+                if video_row is None:
+                    continue
+                video_rows, snapshot_rows = buffers[shard]
+                video_rows.append(video_row)
+                snapshot_rows.extend(new_snapshots)
+                if len(video_rows) + len(snapshot_rows) >= batch_size:
+                    await queues[shard].put(buffers[shard])
+                    buffers[shard] = ([], [])
+            for shard, batch in enumerate(buffers):
+                if batch[0]:
+                    await queues[shard].put(batch)
+                await queues[shard].put(None)
+
+        tasks = [asyncio.create_task(worker(shard)) for shard in range(workers)]
+        tasks.append(asyncio.create_task(reader()))
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            print(f'load interrupted, progress saved to {checkpoint_path}')
+            raise
+
+        if totals['videos'] or not incremental:
+            async with pool.acquire() as conn:
+                await refresh_rollups(conn, checkpoint_range())
+                await bump_data_version(conn)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.perf_counter() - started
+        print(f'loaded {totals["videos"]} videos, {totals["snapshots"]} snapshots with {workers} workers '
+              f'in {elapsed:.1f}s ({(totals["videos"] + totals["snapshots"]) / elapsed:.0f} rows/sec)')
+        return totals, elapsed
+
+    finally:
+        await pool.close()
+
+
 if __name__ == '__main__':
     import sys
-    json_path = sys.argv[1] if len(sys.argv) > 1 else 'videos.json'
+    parser = argparse.ArgumentParser()
+    parser.add_argument('json_path', nargs='?', default='videos.json')
+    parser.add_argument('--bulk', action='store_true', help='потоковый разбор JSON и загрузка батчами через COPY')
+    parser.add_argument('--batch-size', type=int, default=50000, help='строк в одном батче (видео + замеры)')
+    parser.add_argument('--workers', type=int, default=0, help='число параллельных соединений, видео шардируются по id')
+    parser.add_argument('--checkpoint', help='файл прогресса для продолжения прерванной загрузки (по умолчанию <json_path>.checkpoint)')
+    parser.add_argument('--retries', type=int, default=3, help='попыток на один батч шарда')
+    parser.add_argument('--incremental', action='store_true',
+                        help='загружать только замеры новее водяного знака видео (ingest_watermarks), с --bulk или --workers')
+    args = parser.parse_args()
     db_url = getenv('DATABASE_URL')
     if not db_url:
         sys.exit(1)
-    asyncio.run(load_json_to_db(json_path, db_url))
+    if args.workers:
+        asyncio.run(parallel_load_json_to_db(args.json_path, db_url, args.workers, args.batch_size,
+                                             args.checkpoint, args.retries, args.incremental))
+    elif args.bulk or args.incremental:
+        asyncio.run(bulk_load_json_to_db(args.json_path, db_url, args.batch_size, args.incremental))
+    else:
+        asyncio.run(load_json_to_db(args.json_path, db_url))
@@ -0,0 +1,128 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    'stage_seconds': 'Длительность этапа обработки вопроса',
+    'stage_failures_total': 'Исключения по этапам',
+    'request_seconds': 'Время от вопроса до готового ответа (без отправки в Telegram)',
+    'requests_total': 'Ответы по пути обработки',
+    'sql_rewrites_total': 'Переписывания SQL перед выполнением',
+    'sql_cache_total': 'Обращения к кэшу результатов SQL',
+    'queue_wait_seconds': 'Ожидание места в этапе конвейера',
+    'busy_total': 'Отказы «занято» по этапам',
+    'db_pool_wait_seconds': 'Ожидание соединения из пула asyncpg',
+    'llm_prompt_eval_seconds': 'Время обработки промпта по данным Ollama (пусто при ранней остановке стрима)',
+    'llm_eval_seconds': 'Время генерации ответа по данным Ollama',
+    'llm_first_chunk_seconds': 'Время до первого фрагмента стрима Ollama (оценка prompt eval в стриминге)',
+    'query_guard_total': 'Сгенерированные запросы, отклонённые по плану или таймауту',
+    'llm_tier_total': 'Ответы моделей каскада: accepted, rejected, failed, cancelled',
+    'llm_tier_seconds': 'Время генерации SQL по моделям каскада',
+    'failures_total': 'Вопросы, на которые ушёл ответ об ошибке',
+    'rate_limited_total': 'Вопросы, отклонённые ограничением частоты (RATE_LIMIT_PER_MINUTE)',
+    'batch_questions_total': 'Вопросы, пришедшие пакетом (/batch)',
+    'batch_saved_seconds_total': 'Оценка сэкономленного пакетным режимом времени относительно вопросов по одному',
+}
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix: str = 'video_bot_'):
+        self.buckets = buckets
+        self.prefix = prefix
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.samples = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = Histogram(self.buckets)
+        series[key].observe(value)
+        if self.samples is not None:
+            self.samples.setdefault((name, key), []).append(value)
+
+    def gauge(self, name: str, func, help_text: str = ''):
+        self.gauges[name] = (func, help_text)
+
+    @contextmanager
+    def timer(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('stage_failures_total', stage=stage)
+            raise
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - started, stage=stage)
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            full = self.prefix + name
+            lines += [f'# HELP {full} {HELP.get(name, name)}', f'# TYPE {full} counter']
+            lines += [f'{full}{format_labels(key)} {value}' for key, value in sorted(series.items())]
+        for name, series in sorted(self.histograms.items()):
+            full = self.prefix + name
+            lines += [f'# HELP {full} {HELP.get(name, name)}', f'# TYPE {full} histogram']
+            for key, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{full}_bucket{format_labels(key, [("le", bound)])} {cumulative}')
+                lines.append(f'{full}_bucket{format_labels(key, [("le", "+Inf")])} {hist.count}')
+                lines.append(f'{full}_sum{format_labels(key)} {hist.sum}')
+                lines.append(f'{full}_count{format_labels(key)} {hist.count}')
+        for name, (func, help_text) in sorted(self.gauges.items()):
+            full = self.prefix + name
+            lines += [f'# HELP {full} {help_text or name}', f'# TYPE {full} gauge']
+            for labels, value in func().items():
+                lines.append(f'{full}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    async def handle(self, request):
+        return web.Response(
+            body=self.render().encode(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        )
+
+    async def start_server(self, host: str = '127.0.0.1', port: int = 9108):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+metrics = Metrics()
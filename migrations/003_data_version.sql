@@ -0,0 +1,8 @@
+-- Версия данных: load_data.py увеличивает её после каждой загрузки, кэши бота по ней инвалидируются
+CREATE TABLE IF NOT EXISTS data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO data_version DEFAULT VALUES ON CONFLICT DO NOTHING;
@@ -0,0 +1,56 @@
+-- Почасовые и посуточные агрегаты замеров по креаторам (границы часов и суток — в UTC).
+-- Поддерживаются load_data.py инкрементально, бот переписывает подходящие запросы к video_snapshots на них.
+CREATE TABLE IF NOT EXISTS snapshot_rollup_hourly (
+    creator_id VARCHAR(255) NOT NULL,
+    bucket_hour TIMESTAMP WITH TIME ZONE NOT NULL,
+    snapshots_count BIGINT NOT NULL DEFAULT 0,
+    negative_views_count BIGINT NOT NULL DEFAULT 0,
+    delta_views_count BIGINT NOT NULL DEFAULT 0,
+    delta_likes_count BIGINT NOT NULL DEFAULT 0,
+    delta_comments_count BIGINT NOT NULL DEFAULT 0,
+    delta_reports_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (creator_id, bucket_hour)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rollup_hourly_bucket ON snapshot_rollup_hourly(bucket_hour);
+
+CREATE TABLE IF NOT EXISTS snapshot_rollup_daily (
+    creator_id VARCHAR(255) NOT NULL,
+    bucket_date DATE NOT NULL,
+    snapshots_count BIGINT NOT NULL DEFAULT 0,
+    negative_views_count BIGINT NOT NULL DEFAULT 0,
+    delta_views_count BIGINT NOT NULL DEFAULT 0,
+    delta_likes_count BIGINT NOT NULL DEFAULT 0,
+    delta_comments_count BIGINT NOT NULL DEFAULT 0,
+    delta_reports_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (creator_id, bucket_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rollup_daily_bucket ON snapshot_rollup_daily(bucket_date);
+
+INSERT INTO snapshot_rollup_hourly
+SELECT v.creator_id,
+       date_trunc('hour', vs.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+       COUNT(*),
+       COUNT(*) FILTER (WHERE vs.delta_views_count < 0),
+       SUM(vs.delta_views_count),
+       SUM(vs.delta_likes_count),
+       SUM(vs.delta_comments_count),
+       SUM(vs.delta_reports_count)
+FROM video_snapshots vs
+JOIN videos v ON v.id = vs.video_id
+GROUP BY 1, 2
+ON CONFLICT DO NOTHING;
+
+INSERT INTO snapshot_rollup_daily
+SELECT creator_id,
+       (bucket_hour AT TIME ZONE 'UTC')::date,
+       SUM(snapshots_count),
+       SUM(negative_views_count),
+       SUM(delta_views_count),
+       SUM(delta_likes_count),
+       SUM(delta_comments_count),
+       SUM(delta_reports_count)
+FROM snapshot_rollup_hourly
+GROUP BY 1, 2
+ON CONFLICT DO NOTHING;
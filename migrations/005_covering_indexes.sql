@@ -0,0 +1,28 @@
+-- Индексы под формы запросов, которые строят бот и sql_rules.py после переписывания
+-- DATE(...)/EXTRACT(HOUR ...) в диапазоны по времени (sargable.py).
+
+-- Прирост и замеры за дату/период по всем видео: index-only scan по created_at.
+CREATE INDEX IF NOT EXISTS idx_snapshots_created_at_cover ON video_snapshots (created_at)
+    INCLUDE (video_id, delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count);
+
+-- Замеры видео креатора за дату и часы (JOIN videos по video_id).
+CREATE INDEX IF NOT EXISTS idx_snapshots_video_created_at ON video_snapshots (video_id, created_at)
+    INCLUDE (delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count);
+
+-- Замеры с отрицательным приростом просмотров.
+CREATE INDEX IF NOT EXISTS idx_snapshots_negative_views ON video_snapshots (created_at)
+    WHERE delta_views_count < 0;
+
+-- Видео креатора за период публикации и с порогом по итоговым просмотрам.
+CREATE INDEX IF NOT EXISTS idx_videos_creator_published ON videos (creator_id, video_created_at)
+    INCLUDE (views_count);
+
+-- Суммы итоговой статистики за период публикации.
+CREATE INDEX IF NOT EXISTS idx_videos_published_cover ON videos (video_created_at)
+    INCLUDE (views_count, likes_count, comments_count, reports_count);
+
+-- Перекрыты составными индексами выше.
+DROP INDEX IF EXISTS idx_snapshots_created_at;
+DROP INDEX IF EXISTS idx_snapshots_video_id;
+DROP INDEX IF EXISTS idx_videos_creator_id;
+DROP INDEX IF EXISTS idx_videos_created_at;
@@ -0,0 +1,12 @@
+-- Водяные знаки инкрементальной загрузки: время последнего загруженного замера по каждому видео.
+-- load_data.py обновляет их во всех режимах, а с --incremental пропускает замеры не новее водяного знака.
+CREATE TABLE IF NOT EXISTS ingest_watermarks (
+    video_id UUID PRIMARY KEY REFERENCES videos(id) ON DELETE CASCADE,
+    last_snapshot_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+INSERT INTO ingest_watermarks (video_id, last_snapshot_at)
+SELECT video_id, MAX(created_at)
+FROM video_snapshots
+GROUP BY video_id
+ON CONFLICT DO NOTHING;
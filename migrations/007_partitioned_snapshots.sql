@@ -0,0 +1,63 @@
+-- Секционирование video_snapshots по диапазонам created_at (по умолчанию помесячно, см. partitions.py).
+-- Первичный ключ секционированной таблицы обязан включать ключ секционирования: (id, created_at).
+-- Секции на будущие периоды создаёт load_data.py, строки вне секций попадают в video_snapshots_default.
+-- Пустая таблица (новая установка) переключается сразу, существующие данные переносит
+-- python partitions.py migrate.
+
+CREATE OR REPLACE FUNCTION create_partitioned_snapshots() RETURNS void AS $$
+BEGIN
+    CREATE TABLE IF NOT EXISTS video_snapshots_partitioned (
+        id VARCHAR(255) NOT NULL,
+        video_id UUID NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+        views_count INTEGER NOT NULL DEFAULT 0,
+        likes_count INTEGER NOT NULL DEFAULT 0,
+        comments_count INTEGER NOT NULL DEFAULT 0,
+        reports_count INTEGER NOT NULL DEFAULT 0,
+        delta_views_count INTEGER NOT NULL DEFAULT 0,
+        delta_likes_count INTEGER NOT NULL DEFAULT 0,
+        delta_comments_count INTEGER NOT NULL DEFAULT 0,
+        delta_reports_count INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        CONSTRAINT video_snapshots_partitioned_pkey PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    CREATE TABLE IF NOT EXISTS video_snapshots_default PARTITION OF video_snapshots_partitioned DEFAULT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Подменяет video_snapshots секционированной таблицей; индексы из 005 создаются на родителе
+-- и наследуются всеми секциями. keep_old оставляет старую таблицу как video_snapshots_unpartitioned.
+CREATE OR REPLACE FUNCTION swap_partitioned_snapshots(keep_old BOOLEAN) RETURNS void AS $$
+BEGIN
+    IF keep_old THEN
+        ALTER TABLE video_snapshots RENAME TO video_snapshots_unpartitioned;
+        ALTER TABLE video_snapshots_unpartitioned RENAME CONSTRAINT video_snapshots_pkey TO video_snapshots_unpartitioned_pkey;
+        ALTER INDEX IF EXISTS idx_snapshots_created_at_cover RENAME TO idx_snapshots_unpartitioned_created_at_cover;
+        ALTER INDEX IF EXISTS idx_snapshots_video_created_at RENAME TO idx_snapshots_unpartitioned_video_created_at;
+        ALTER INDEX IF EXISTS idx_snapshots_negative_views RENAME TO idx_snapshots_unpartitioned_negative_views;
+    ELSE
+        DROP TABLE video_snapshots;
+    END IF;
+    ALTER TABLE video_snapshots_partitioned RENAME TO video_snapshots;
+    ALTER TABLE video_snapshots RENAME CONSTRAINT video_snapshots_partitioned_pkey TO video_snapshots_pkey;
+    CREATE INDEX IF NOT EXISTS idx_snapshots_created_at_cover ON video_snapshots (created_at)
+        INCLUDE (video_id, delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count);
+    CREATE INDEX IF NOT EXISTS idx_snapshots_video_created_at ON video_snapshots (video_id, created_at)
+        INCLUDE (delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count);
+    CREATE INDEX IF NOT EXISTS idx_snapshots_negative_views ON video_snapshots (created_at)
+        WHERE delta_views_count < 0;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'video_snapshots'::regclass) = 'r' THEN
+        PERFORM create_partitioned_snapshots();
+        IF NOT EXISTS (SELECT 1 FROM video_snapshots) THEN
+            PERFORM swap_partitioned_snapshots(FALSE);
+        ELSE
+            RAISE NOTICE 'video_snapshots содержит данные: перенесите их командой python partitions.py migrate';
+        END IF;
+    END IF;
+END;
+$$;
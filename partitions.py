@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import gzip
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from os import getenv
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PARTITION_MONTHS = int(getenv('SNAPSHOT_PARTITION_MONTHS', '1'))
+PARENT = 'video_snapshots'
+STAGING_PARENT = 'video_snapshots_partitioned'
+DEFAULT_PARTITION = 'video_snapshots_default'
+LOCK_KEY = 7_000_001
+BOUND_RE = re.compile(r"FROM \('(?P<lo>[^']+)'\) TO \('(?P<hi>[^']+)'\)")
+
+BOUNDS_SQL = """
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = $1::regclass
+"""
+
+
+def add_months(ts: datetime, months: int) -> datetime:
+    index = ts.year * 12 + ts.month - 1 + months
+    return ts.replace(year=index // 12, month=index % 12 + 1)
+
+
+def period_start(ts: datetime, months: int = PARTITION_MONTHS) -> datetime:
+    ts = ts.astimezone(timezone.utc)
+    index = (ts.year * 12 + ts.month - 1) // months * months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(lo: datetime) -> str:
+    return f'{PARENT}_p{lo:%Y%m}'
+
+
+async def is_partitioned(conn, table: str = PARENT) -> bool:
+    return await conn.fetchval('SELECT relkind::text FROM pg_class WHERE oid = to_regclass($1)', table) == 'p'
+
+
+async def partition_bounds(conn, parent: str = PARENT):
+    bounds = []
+    for name, expr in await conn.fetch(BOUNDS_SQL, parent):
+        m = BOUND_RE.search(expr)
+        if m:
+            bounds.append((name, datetime.fromisoformat(m.group('lo')), datetime.fromisoformat(m.group('hi'))))
+    return sorted(bounds, key=lambda bound: bound[1])
+
+
+def uncovered(lo: datetime, hi: datetime, bounds):
+    for _, b_lo, b_hi in bounds:
+        if b_lo <= lo < b_hi:
+            lo = b_hi
+    for _, b_lo, _ in bounds:
+        if lo < b_lo < hi:
+            hi = b_lo
+    return (lo, hi) if lo < hi else None
+
+
+async def create_partition(conn, parent: str, lo: datetime, hi: datetime):
+    name = partition_name(lo)
+    bounds = f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+    stray = await conn.fetchval(
+        f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= $1 AND created_at < $2)', lo, hi
+    )
+    if not stray:
+        await conn.execute(f'CREATE TABLE {name} PARTITION OF {parent} {bounds}')
+        return name
+    await conn.execute(f'ALTER TABLE {parent} DETACH PARTITION {DEFAULT_PARTITION}')
+    await conn.execute(f'CREATE TABLE {name} PARTITION OF {parent} {bounds}')
+    await conn.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= $1 AND created_at < $2 RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, lo, hi)
+    await conn.execute(f'ALTER TABLE {parent} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+    return name
+
+
+async def ensure_partitions(conn, lo: datetime, hi: datetime, ahead: int = 0,
+                            months: int = PARTITION_MONTHS, parent: str = PARENT):
+    if not await is_partitioned(conn, parent):
+        return []
+    periods = []
+    start, last = period_start(lo, months), add_months(period_start(hi, months), ahead * months)
+    while start <= last:
+        periods.append(start)
+        start = add_months(start, months)
+    created = []
+    async with conn.transaction():
+        await conn.execute('SELECT pg_advisory_xact_lock($1)', LOCK_KEY)
+        bounds = await partition_bounds(conn, parent)
+        for start in periods:
+            gap = uncovered(start, add_months(start, months), bounds)
+            if gap:
+                created.append(await create_partition(conn, parent, *gap))
+                bounds = await partition_bounds(conn, parent)
+    return created
+
+
+async def archive(conn, path: str, sql_query: str, *args):
+    tmp_path = f'{path}.tmp'
+    with gzip.open(tmp_path, 'wb') as f:
+        async def write(data):
+            f.write(data)
+
+        await conn.copy_from_query(sql_query, *args, output=write, format='csv', header=True)
+    os.replace(tmp_path, path)
+
+
+async def drop_rollups(conn, lo, hi):
+    await conn.execute('DELETE FROM snapshot_rollup_hourly WHERE bucket_hour >= $1 AND bucket_hour < $2', lo, hi)
+    await conn.execute('DELETE FROM snapshot_rollup_daily WHERE bucket_date >= $1 AND bucket_date < $2',
+                       lo.date(), hi.date())
+
+
+async def apply_retention(conn, keep_months: int, archive_dir: str = None, dry_run: bool = False,
+                          keep_rollups: bool = False):
+    from load_data import bump_data_version
+
+    if not await is_partitioned(conn):
+        print('video_snapshots не секционирована: сначала выполните python partitions.py migrate')
+        return []
+    cutoff = add_months(period_start(datetime.now(timezone.utc), 1), -keep_months)
+    expired = [bound for bound in await partition_bounds(conn) if bound[2] <= cutoff]
+    stray = await conn.fetchval(f'SELECT COUNT(*) FROM {DEFAULT_PARTITION} WHERE created_at < $1', cutoff)
+    print(f'граница хранения {cutoff:%Y-%m-%d}: секций к удалению {len(expired)}, '
+          f'строк в {DEFAULT_PARTITION} старше границы {stray}')
+    if dry_run:
+        for name, lo, hi in expired:
+            print(f'  {name}: {lo:%Y-%m-%d} — {hi:%Y-%m-%d}')
+        return [name for name, _, _ in expired]
+
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+    for name, lo, hi in expired:
+        started = time.perf_counter()
+        if archive_dir:
+            await archive(conn, os.path.join(archive_dir, f'{name}.csv.gz'), f'SELECT * FROM {name}')
+        async with conn.transaction():
+            await conn.execute(f'ALTER TABLE {PARENT} DETACH PARTITION {name}')
+            await conn.execute(f'DROP TABLE {name}')
+            if not keep_rollups:
+                await drop_rollups(conn, lo, hi)
+        print(f'  {name}: удалена{" с архивом" if archive_dir else ""} за {time.perf_counter() - started:.1f}s')
+    if stray:
+        if archive_dir:
+            await archive(conn, os.path.join(archive_dir, f'{DEFAULT_PARTITION}_{cutoff:%Y%m}.csv.gz'),
+                          f'SELECT * FROM {DEFAULT_PARTITION} WHERE created_at < $1', cutoff)
+        async with conn.transaction():
+            await conn.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE created_at < $1', cutoff)
+            if not keep_rollups:
+                await drop_rollups(conn, datetime(1970, 1, 1, tzinfo=timezone.utc), cutoff)
+    if expired or stray:
+        await bump_data_version(conn)
+    return [name for name, _, _ in expired]
+
+
+async def migrate(conn, months: int = PARTITION_MONTHS, keep_old: bool = False):
+    from load_data import SNAPSHOT_COLUMNS
+
+    if await is_partitioned(conn):
+        print('video_snapshots уже секционирована')
+        return
+    columns = ', '.join(SNAPSHOT_COLUMNS)
+    copy_sql = f"""
+        INSERT INTO {STAGING_PARENT} ({columns})
+        SELECT {columns} FROM {PARENT} WHERE created_at >= $1 {{upper}}
+        ON CONFLICT DO NOTHING
+    """
+    await conn.execute('SELECT create_partitioned_snapshots()')
+    lo, hi = await conn.fetchrow(f'SELECT MIN(created_at), MAX(created_at) FROM {PARENT}')
+    started = time.perf_counter()
+    last = None
+    if lo is not None:
+        created = await ensure_partitions(conn, lo, hi, ahead=1, months=months, parent=STAGING_PARENT)
+        print(f'создано секций: {len(created)}')
+        for name, b_lo, b_hi in await partition_bounds(conn, STAGING_PARENT):
+            if b_hi <= lo or b_lo > hi:
+                continue
+            step = time.perf_counter()
+            status = await conn.execute(copy_sql.format(upper='AND created_at < $2'), b_lo, b_hi)
+            print(f'  {name}: {status.split()[-1]} строк за {time.perf_counter() - step:.1f}s')
+            last = b_lo
+
+    async with conn.transaction():
+        await conn.execute(f'LOCK TABLE {PARENT} IN EXCLUSIVE MODE')
+        if last is not None:
+            await conn.execute(copy_sql.format(upper=''), last)
+        old_count = await conn.fetchval(f'SELECT COUNT(*) FROM {PARENT}')
+        new_count = await conn.fetchval(f'SELECT COUNT(*) FROM {STAGING_PARENT}')
+        if old_count != new_count:
+            raise RuntimeError(f'перенесено {new_count} из {old_count} замеров: остановите загрузки и повторите')
+        await conn.execute('SELECT swap_partitioned_snapshots($1)', keep_old)
+    await conn.execute(f'ANALYZE {PARENT}')
+    print(f'перенесено {new_count} замеров за {time.perf_counter() - started:.1f}s'
+          f'{", старая таблица: video_snapshots_unpartitioned" if keep_old else ""}')
+
+
+async def show(conn):
+    if not await is_partitioned(conn):
+        print('video_snapshots не секционирована')
+        return
+    rows = await conn.fetch("""
+        SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+    """, PARENT)
+    stats = {name: (tuples, size) for name, tuples, size in rows}
+    for name, lo, hi in await partition_bounds(conn):
+        tuples, size = stats[name]
+        print(f'{name}: {lo:%Y-%m-%d} — {hi:%Y-%m-%d}, ~{max(tuples, 0)} строк, {size / 2 ** 20:.1f} МБ')
+    tuples, size = stats.get(DEFAULT_PARTITION, (0, 0))
+    print(f'{DEFAULT_PARTITION}: ~{max(tuples, 0)} строк, {size / 2 ** 20:.1f} МБ')
+
+
+async def main(args):
+    db_url = getenv('DATABASE_URL')
+    if not db_url:
+        sys.exit(1)
+    conn = await asyncpg.connect(db_url)
+    try:
+        if args.command == 'ensure':
+            now = datetime.now(timezone.utc)
+            created = await ensure_partitions(conn, now, now, ahead=args.ahead)
+            print(f'создано секций: {len(created)}' + (f" ({', '.join(created)})" if created else ''))
+        elif args.command == 'retention':
+            await apply_retention(conn, args.keep_months, args.archive_dir, args.dry_run, args.keep_rollups)
+        elif args.command == 'migrate':
+            await migrate(conn, keep_old=args.keep_old)
+        else:
+            await show(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Секции video_snapshots по created_at (размер секции в месяцах — SNAPSHOT_PARTITION_MONTHS)'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='секции, число строк и размер')
+    ensure = commands.add_parser('ensure', help='создать секцию текущего периода и следующих')
+    ensure.add_argument('--ahead', type=int, default=1, help='сколько следующих периодов создать заранее')
+    retention = commands.add_parser('retention', help='удалить секции старше --keep-months месяцев')
+    retention.add_argument('--keep-months', type=int, required=True,
+                           help='сколько полных месяцев хранить помимо текущего')
+    retention.add_argument('--archive-dir', help='перед удалением выгрузить секции в <dir>/<секция>.csv.gz')
+    retention.add_argument('--keep-rollups', action='store_true',
+                           help='не удалять агрегаты snapshot_rollup_* за удалённые периоды')
+    retention.add_argument('--dry-run', action='store_true', help='только показать, что будет удалено')
+    migrate_parser = commands.add_parser(
+        'migrate', help='перенести данные существующей установки в секционированную таблицу (после миграции 007)'
+    )
+    migrate_parser.add_argument('--keep-old', action='store_true',
+                                help='оставить старую таблицу как video_snapshots_unpartitioned')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,180 @@
+import asyncio
+import time
+from functools import partial
+
+from cache import MISS, normalize_question
+from metrics import metrics
+from rollups import route_to_rollups
+from sargable import rewrite_sargable
+from sql_rules import match_rule, validate_and_fix_sql
+
+
+class Busy(Exception):
+    pass
+
+
+class Stage:
+    def __init__(self, name: str, concurrency: int, queue_size: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_waiting = 0
+        self.wait_seconds = 0.0
+
+    async def run(self, func, *args):
+        if self.semaphore.locked() and self.waiting >= self.queue_size:
+            self.rejected += 1
+            metrics.inc('busy_total', stage=self.name)
+            raise Busy(self.name)
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = time.perf_counter()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        self.wait_seconds += waited
+        metrics.observe('queue_wait_seconds', waited, stage=self.name)
+        self.active += 1
+        try:
+            return await func(*args)
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self.semaphore.release()
+
+    def stats(self):
+        return {
+            'concurrency': self.concurrency,
+            'queue_size': self.queue_size,
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'avg_wait': self.wait_seconds / self.completed if self.completed else 0.0,
+        }
+
+
+class QueryPipeline:
+    def __init__(self, db, llm, templates, answer_cache, llm_concurrency: int = 1, llm_queue_size: int = 8,
+                 db_concurrency: int = 5, db_queue_size: int = 32, use_rollups: bool = True, columnar=None):
+        self.db = db
+        self.columnar = columnar
+        self.llm = llm
+        self.templates = templates
+        self.answer_cache = answer_cache
+        self.use_rollups = use_rollups
+        self.llm_stage = Stage('llm', llm_concurrency, llm_queue_size)
+        self.db_stage = Stage('db', db_concurrency, db_queue_size)
+        self.in_flight = {}
+        self.coalesced = 0
+        self.latency = {}
+        self.trace = None
+
+    async def answer(self, user_query: str) -> str:
+        version = await self.db.data_version()
+        key = normalize_question(user_query)
+        answer = self.answer_cache.get(key, version)
+        if answer is not MISS:
+            metrics.inc('requests_total', path='answer_cache')
+            return answer
+        task = self.in_flight.get(key)
+        if task is None:
+            task = self.in_flight[key] = asyncio.ensure_future(self.compute(user_query, key, version))
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+            metrics.inc('requests_total', path='coalesced')
+        return await asyncio.shield(task)
+
+    async def compute(self, user_query: str, key: str, version) -> str:
+        started = time.perf_counter()
+        generated = False
+        result = MISS
+        with metrics.timer('fixed_match'):
+            match = match_rule(user_query)
+        if match:
+            sql_query, args = match.sql, match.args
+            path = 'fast_path'
+            if self.columnar is not None:
+                with metrics.timer('columnar'):
+                    result = self.columnar.answer(match.name, args, version)
+                if result is MISS:
+                    self.columnar.schedule_refresh(self.db)
+                else:
+                    path = 'columnar'
+        else:
+            with metrics.timer('template_lookup'):
+                template = self.templates.lookup(user_query)
+            if template:
+                sql_query, args = template
+                path = 'template'
+            else:
+                with metrics.timer('llm_build'):
+                    generated_sql = await self.llm_stage.run(self.llm.build_query, user_query)
+                self.observe_llm()
+                with metrics.timer('validation'):
+                    sql_query, args = validate_and_fix_sql(generated_sql, user_query)
+                if sql_query != generated_sql:
+                    metrics.inc('sql_rewrites_total', kind='validation')
+                generated = not args
+                path = 'llm'
+
+        if result is MISS:
+            result = await self.run_sql(sql_query, args, path)
+        if generated:
+            self.templates.store(user_query, sql_query)
+        answer = '0' if result is None else str(int(result))
+        elapsed = time.perf_counter() - started
+        self.answer_cache.set(key, answer, elapsed, version)
+        self.observe_latency(match.name if path == 'fast_path' else path, elapsed)
+        if self.trace is not None:
+            self.trace[key] = (path, sql_query)
+        metrics.inc('requests_total', path=path)
+        metrics.observe('request_seconds', elapsed, path=path)
+        return answer
+
+    async def run_sql(self, sql_query: str, args, path: str):
+        if not sql_query.strip().upper().startswith('SELECT'):
+            metrics.inc('stage_failures_total', stage='sql_check')
+            raise ValueError("Некорректный SQL")
+
+        with metrics.timer('sql_rewrite'):
+            routed = route_to_rollups(sql_query) if self.use_rollups else None
+            final_sql = rewrite_sargable(routed or sql_query)
+        if routed:
+            metrics.inc('sql_rewrites_total', kind='rollup')
+        if final_sql != (routed or sql_query):
+            metrics.inc('sql_rewrites_total', kind='sargable')
+        execute = partial(self.db.execute_query, guarded=path != 'fast_path')
+        with metrics.timer('db_execute'):
+            return await self.db_stage.run(execute, final_sql, *args)
+
+    def observe_latency(self, kind: str, elapsed: float):
+        previous = self.latency.get(kind)
+        self.latency[kind] = elapsed if previous is None else previous * 0.8 + elapsed * 0.2
+
+    def observe_llm(self):
+        stats = getattr(self.llm, 'last_stats', {})
+        for name in ('prompt_eval_seconds', 'eval_seconds', 'first_chunk_seconds'):
+            if name in stats:
+                metrics.observe(f'llm_{name}', stats[name])
+        for attempt in stats.get('attempts', ()):
+            metrics.inc('llm_tier_total', model=attempt['model'], result=attempt['result'])
+            if attempt['seconds']:
+                metrics.observe('llm_tier_seconds', attempt['seconds'], model=attempt['model'])
+
+    def stats(self):
+        return {
+            'in_flight': len(self.in_flight),
+            'coalesced': self.coalesced,
+            'llm': self.llm_stage.stats(),
+            'db': self.db_stage.stats(),
+        }
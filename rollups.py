@@ -0,0 +1,100 @@
+import re
+
+VALUE = r"(?:'[^']*'|\$\d+(?:::\w+)?)"
+DATE_VALUE = r"(?:'\d{4}-\d{2}-\d{2}'|\$\d+::date)"
+COLUMN = r'(?:(?P<prefix>\w+)\.)?'
+
+SELECT_RE = re.compile(
+    r'SELECT\s+(?:(?P<coalesce>COALESCE\(\s*)?SUM\(\s*(?:(?P<sum_alias>\w+)\.)?(?P<column>delta_(?:views|likes|comments|reports)_count)\s*\)'
+    r'(?(coalesce)\s*,\s*0\s*\))|(?P<count>COUNT\(\s*\*\s*\)))'
+    r'\s+FROM\s+video_snapshots(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|INNER)\b)(?P<alias>\w+))?'
+    r'(?P<join>\s+(?:INNER\s+)?JOIN\s+videos\s+(?:AS\s+)?(?P<videos>\w+)\s+ON\s+'
+    r'(?:(?P=alias)\.video_id\s*=\s*(?P=videos)\.id|(?P=videos)\.id\s*=\s*(?P=alias)\.video_id))?'
+    r'(?:\s+WHERE\s+(?P<where>.+?))?\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL,
+)
+
+PREDICATES = [
+    ('creator', re.compile(COLUMN + rf'creator_id\s*=\s*(?P<value>{VALUE})', re.IGNORECASE)),
+    ('day_between', re.compile(
+        rf'DATE\(\s*{COLUMN}created_at\s*\)\s+BETWEEN\s+(?P<low>{VALUE})\s+AND\s+(?P<high>{VALUE})', re.IGNORECASE)),
+    ('day', re.compile(rf'DATE\(\s*{COLUMN}created_at\s*\)\s*=\s*(?P<value>{VALUE})', re.IGNORECASE)),
+    ('hour', re.compile(
+        rf'EXTRACT\(\s*HOUR\s+FROM\s+{COLUMN}created_at\s*\)\s*(?P<op>>=|<=|<|>|=)\s*(?P<value>\$\d+(?:::\w+)?|\d+)',
+        re.IGNORECASE)),
+    ('since', re.compile(rf'{COLUMN}created_at\s*(?P<op>>=|<)\s*(?P<value>{DATE_VALUE})', re.IGNORECASE)),
+    ('negative', re.compile(rf'{COLUMN}delta_views_count\s*<\s*0\b', re.IGNORECASE)),
+]
+AND_RE = re.compile(r'\s+AND\s+', re.IGNORECASE)
+
+
+def parse_predicates(where: str):
+    predicates = []
+    pos = 0
+    while pos < len(where):
+        for kind, pattern in PREDICATES:
+            m = pattern.match(where, pos)
+            if m:
+                predicates.append((kind, m))
+                pos = m.end()
+                break
+        else:
+            return None
+        if pos < len(where):
+            m = AND_RE.match(where, pos)
+            if not m:
+                return None
+            pos = m.end()
+    return predicates
+
+
+def route_to_rollups(sql_query: str):
+    m = SELECT_RE.match(sql_query.strip())
+    if not m:
+        return None
+    predicates = parse_predicates(m.group('where').strip()) if m.group('where') else []
+    if predicates is None:
+        return None
+    snapshots, videos = m.group('alias'), m.group('videos')
+    if m.group('sum_alias') not in (None, snapshots):
+        return None
+    for kind, p in predicates:
+        if p.group('prefix') not in (None, videos if kind == 'creator' else snapshots):
+            return None
+    kinds = [kind for kind, _ in predicates]
+    if 'creator' in kinds and not m.group('join'):
+        return None
+    if 'negative' in kinds and not m.group('count'):
+        return None
+
+    hourly = 'hour' in kinds or 'since' in kinds
+    if hourly:
+        table, day, hour = 'snapshot_rollup_hourly', 'DATE(bucket_hour)', 'EXTRACT(HOUR FROM bucket_hour)'
+    else:
+        table, day, hour = 'snapshot_rollup_daily', 'bucket_date', None
+
+    conditions = []
+    for kind, p in predicates:
+        if kind == 'creator':
+            conditions.append(f"creator_id = {p.group('value')}")
+        elif kind == 'day_between':
+            conditions.append(f"{day} BETWEEN {p.group('low')} AND {p.group('high')}")
+        elif kind == 'day':
+            conditions.append(f"{day} = {p.group('value')}")
+        elif kind == 'hour':
+            conditions.append(f"{hour} {p.group('op')} {p.group('value')}")
+        elif kind == 'since':
+            conditions.append(f"bucket_hour {p.group('op')} {p.group('value')}")
+
+    if m.group('count'):
+        column = 'negative_views_count' if 'negative' in kinds else 'snapshots_count'
+        aggregate = f'COALESCE(SUM({column}), 0)::bigint'
+    elif m.group('coalesce'):
+        aggregate = f"COALESCE(SUM({m.group('column').lower()}), 0)"
+    else:
+        aggregate = f"SUM({m.group('column').lower()})"
+
+    routed = f'SELECT {aggregate} FROM {table}'
+    if conditions:
+        routed += ' WHERE ' + ' AND '.join(conditions)
+    return routed
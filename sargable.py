@@ -0,0 +1,97 @@
+import re
+
+TIMEZONE = 'UTC'
+
+COLUMN = r'(?:\w+\.)?\w+'
+VALUE = r"(?:'[^']*'(?:::\w+)?|\$\d+(?:::\w+)?)"
+DAY = rf'(?:(?<![\w.])DATE\(\s*(?P<col>{COLUMN})\s*\)|(?<![\w.$\'])(?P<cast_col>{COLUMN})::date)'
+HOUR_VALUE = r'(?:\d+|\$\d+::(?:int|integer|int4|bigint|int8|smallint))'
+
+DATE_BETWEEN_RE = re.compile(rf'{DAY}\s+BETWEEN\s+(?P<low>{VALUE})\s+AND\s+(?P<high>{VALUE})', re.IGNORECASE)
+DATE_CMP_RE = re.compile(rf'{DAY}\s*(?P<op>>=|<=|=|>|<)\s*(?P<value>{VALUE})', re.IGNORECASE)
+HOUR_CMP_RE = re.compile(
+    rf'EXTRACT\(\s*HOUR\s+FROM\s+(?P<col>{COLUMN})\s*\)\s*(?P<op>>=|<=|=|>|<)\s*(?P<value>{HOUR_VALUE})',
+    re.IGNORECASE,
+)
+OR_RE = re.compile(r'\bOR\b', re.IGNORECASE)
+INT_CASTS = ('::int', '::integer', '::int4')
+
+
+def as_date(value: str) -> str:
+    if value.lower().endswith('::date'):
+        return value
+    if '::' in value:
+        return f'({value})::date'
+    return f'{value}::date'
+
+
+def plus_one(hour):
+    return hour + 1 if isinstance(hour, int) else f'{hour} + 1'
+
+
+def day_bound(value: str, days: int = 0, hour=None) -> str:
+    day = as_date(value)
+    if days:
+        day = f'({day} + {days})'
+    if hour is None:
+        moment = f'{day}::timestamp'
+    else:
+        hours = hour if isinstance(hour, int) or hour.lower().endswith(INT_CASTS) else f'({hour})::int'
+        moment = f'({day} + make_interval(hours => {hours}))'
+    return f"{moment} AT TIME ZONE '{TIMEZONE}'"
+
+
+def day_range(col: str, low: str, high: str, first_hour=None, end_hour=None) -> str:
+    start = day_bound(low, hour=first_hour) if first_hour not in (None, 0) else day_bound(low)
+    if end_hour in (None, 24):
+        end = day_bound(high, days=1)
+    else:
+        end = day_bound(high, hour=end_hour)
+    return f'({col} >= {start} AND {col} < {end})'
+
+
+def hour_window(sql_query: str):
+    windows = {}
+    for m in HOUR_CMP_RE.finditer(sql_query):
+        value = m.group('value')
+        hour = int(value) if value.isdigit() else value
+        op = m.group('op')
+        low, high = windows.setdefault(m.group('col').lower(), [[], []])
+        if op in ('>=', '='):
+            low.append(hour)
+        if op == '>':
+            low.append(plus_one(hour))
+        if op == '<':
+            high.append(hour)
+        if op in ('<=', '='):
+            high.append(plus_one(hour))
+    return {
+        col: (low[0] if low else None, high[0] if high else None)
+        for col, (low, high) in windows.items()
+        if len(low) <= 1 and len(high) <= 1
+    }
+
+
+def rewrite_sargable(sql_query: str) -> str:
+    windows = {} if OR_RE.search(sql_query) else hour_window(sql_query)
+
+    def between(m):
+        col = m.group('col') or m.group('cast_col')
+        return day_range(col, m.group('low'), m.group('high'))
+
+    def compare(m):
+        col = m.group('col') or m.group('cast_col')
+        op, value = m.group('op'), m.group('value')
+        if op == '=':
+            first_hour, end_hour = windows.get(col.lower(), (None, None))
+            return day_range(col, value, value, first_hour, end_hour)
+        if op == '>=':
+            return f'{col} >= {day_bound(value)}'
+        if op == '>':
+            return f'{col} >= {day_bound(value, days=1)}'
+        if op == '<':
+            return f'{col} < {day_bound(value)}'
+        return f'{col} < {day_bound(value, days=1)}'
+
+    sql_query = DATE_BETWEEN_RE.sub(between, sql_query)
+    return DATE_CMP_RE.sub(compare, sql_query)
@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+from os import getenv
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from batch import answer_batch
+from cache import ResultCache
+from database import Database
+from llm_query import LLMQueryBuilder
+from pipeline import QueryPipeline
+from stub_ollama import StubOllama
+from template_cache import TemplateCache
+
+load_dotenv()
+
+MONTHS = ('января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля', 'августа', 'сентября', 'октября',
+          'ноября', 'декабря')
+
+
+def day_text(day: date) -> str:
+    return f'{day.day} {MONTHS[day.month - 1]} {day.year} года'
+
+
+def make_questions(creator_ids, first_day: date, args):
+    questions = []
+    for creator_id in creator_ids[:args.creators]:
+        questions.append(f'Сколько видео у креатора с id {creator_id} набрали больше {args.threshold} просмотров '
+                         f'по итоговой статистике?')
+    for creator_id in creator_ids[:args.creators]:
+        questions.append(f'Для креатора с id {creator_id} посчитай, в скольких разных календарных днях '
+                         f'{MONTHS[first_day.month - 1]} {first_day.year} года он публиковал хотя бы одно видео.')
+    for offset in range(args.days):
+        questions.append(f'На сколько просмотров суммарно выросли все видео креатора с id {creator_ids[0]} '
+                         f'в промежутке с 10:00 до 15:00 {day_text(first_day + timedelta(days=offset))}?')
+    for i in range(args.llm):
+        questions.append(f'Сколько всего видео есть в системе? Вопрос №{i}')
+    return questions
+
+
+def make_pipeline(db, llm, args):
+    return QueryPipeline(db, llm, TemplateCache(path=None), ResultCache(), llm_concurrency=args.llm_parallel,
+                         llm_queue_size=1024, db_queue_size=1024,
+                         use_rollups=not args.no_rollups)
+
+
+async def main(args):
+    db_url = getenv('DATABASE_URL')
+    if not db_url:
+        sys.exit(1)
+    stub = StubOllama(args.llm_latency, parallel=args.llm_parallel)
+    llm = LLMQueryBuilder(ollama_url=await stub.start(), model='stub', stream=False, parallel=args.llm_parallel)
+    db = Database(db_url)
+    await db.connect()
+    try:
+        async with db.pool.acquire() as conn:
+            creator_ids = [row[0] for row in await conn.fetch(
+                'SELECT creator_id FROM videos GROUP BY creator_id ORDER BY COUNT(*) DESC LIMIT $1', args.creators)]
+            first_day = await conn.fetchval('SELECT MIN(created_at)::date FROM video_snapshots') + timedelta(days=1)
+        questions = make_questions(creator_ids, first_day, args)
+
+        warm = make_pipeline(db, llm, args)
+        await answer_batch(warm, questions)
+
+        solo = make_pipeline(db, llm, args)
+        started = time.perf_counter()
+        expected = [await solo.answer(question) for question in questions]
+        solo_seconds = time.perf_counter() - started
+
+        batched = make_pipeline(db, llm, args)
+        batched.latency = dict(solo.latency)
+        result = await answer_batch(batched, questions)
+    finally:
+        await db.close()
+        await llm.close()
+        await stub.stop()
+
+    wrong = [(q, a, e) for q, a, e in zip(questions, result.answers, expected) if a != e]
+    print(f'вопросов {len(questions)}: {args.creators} × 2 по креаторам, {args.days} по дням, {args.llm} через LLM '
+          f'(заглушка {args.llm_latency} с, параллельно {args.llm_parallel})')
+    print(f'по одному: {solo_seconds:.2f} с')
+    print(f'пакетом:   {result.elapsed:.2f} с, запросов с GROUP BY {len(result.groups)} '
+          f'({", ".join(f"{rule} × {size}" for rule, size in result.groups)})')
+    print(f'оценка пакета «по отдельности» {result.solo_seconds:.2f} с, сэкономлено ≈ {result.saved_seconds:.2f} с, '
+          f'фактически {solo_seconds - result.elapsed:.2f} с (x{solo_seconds / result.elapsed:.1f})')
+    print(f'расхождений с ответами по одному: {len(wrong)}')
+    for question, answer, answer_solo in wrong[:10]:
+        print(f'  {question}\n    пакет {answer!r}, по одному {answer_solo!r}')
+    return 1 if wrong else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Сравнение пакетного режима (/batch) с ответами по одному: общие запросы с GROUP BY для '
+                    'однотипных вопросов по разным креаторам и дням, параллельная генерация SQL '
+                    '(база из DATABASE_URL, заглушка Ollama)'
+    )
+    parser.add_argument('--creators', type=int, default=10, help='вопросов на каждую метрику по креаторам')
+    parser.add_argument('--days', type=int, default=10, help='вопросов о приросте просмотров по дням')
+    parser.add_argument('--llm', type=int, default=4, help='вопросов без быстрого пути')
+    parser.add_argument('--threshold', type=int, default=10000)
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--llm-parallel', type=int, default=4)
+    parser.add_argument('--no-rollups', action='store_true')
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_query import LLMQueryBuilder
+from sql_rules import get_fixed_sql_for_question, sql_problems
+from stub_ollama import StubOllama
+
+CORPUS_PATH = Path(__file__).resolve().parent / 'accuracy_corpus.json'
+SMALL, LARGE = 'small', 'large'
+
+
+def canned(corpus, all_questions: bool):
+    responses = {}
+    for entry in corpus['questions']:
+        question = entry['question']
+        if not all_questions and get_fixed_sql_for_question(question):
+            continue
+        reference = entry['reference_sql']
+        responses[(LARGE, question)] = entry.get('llm_sql', reference)
+        responses[(SMALL, question)] = reference.replace('delta_', 'increase_') if 'video_snapshots' in reference \
+            else entry.get('llm_sql', reference)
+    return responses
+
+
+async def run(url: str, stub: StubOllama, questions, repeats: int, **kwargs):
+    llm = LLMQueryBuilder(ollama_url=url, stream=True, **kwargs)
+    stub.calls = 0
+    latencies, bad = [], 0
+    try:
+        for _ in range(repeats):
+            for question in questions:
+                sql_query = await llm.build_query(question)
+                latencies.append(llm.last_stats['seconds'])
+                bad += bool(sql_problems(sql_query, question))
+    finally:
+        await llm.close()
+    await asyncio.sleep(0.1)
+    return latencies, bad, stub.calls, llm.tiers
+
+
+async def main(args):
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    responses = canned(corpus, args.all)
+    questions = sorted({question for _, question in responses})
+    stub = StubOllama(args.large_latency, parallel=2, responses=responses, token_latency=args.token_latency,
+                      model_latency={SMALL: args.small_latency, LARGE: args.large_latency})
+    url = await stub.start()
+    try:
+        report = {
+            'только большая': await run(url, stub, questions, args.repeats, model=LARGE),
+            'каскад': await run(url, stub, questions, args.repeats, model=LARGE, fast_model=SMALL),
+            'спекулятивно': await run(url, stub, questions, args.repeats, model=LARGE, fast_model=SMALL,
+                                      speculative=True, parallel=2),
+        }
+    finally:
+        await stub.stop()
+
+    print(f'вопросов без быстрого пути: {len(questions)}, повторов {args.repeats}')
+    for name, (latencies, bad, calls, tiers) in report.items():
+        print(f'\n{name:>15}: медиана {statistics.median(latencies) * 1000:6.0f} мс, '
+              f'p90 {sorted(latencies)[int(0.9 * len(latencies))] * 1000:6.0f} мс, '
+              f'вызовов Ollama {calls}, SQL с проблемами {bad}')
+        for model, st in tiers.items():
+            finished = st['accepted'] + st['rejected'] + st['failed']
+            print(f'{model:>21}: принято {st["accepted"]}/{finished}, отклонено {st["rejected"]}, '
+                  f'отменено {st["cancelled"]}, среднее {st["seconds"] / finished * 1000 if finished else 0:.0f} мс')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Латентность и доля ответов малой модели: одна большая модель, каскад малая → большая '
+                    'и параллельная спекулятивная генерация (заглушка Ollama с двумя моделями)'
+    )
+    parser.add_argument('--corpus', default=str(CORPUS_PATH))
+    parser.add_argument('--all', action='store_true', help='включить вопросы, которые закрывает быстрый путь')
+    parser.add_argument('--small-latency', type=float, default=0.2, help='время до первого токена малой модели, с')
+    parser.add_argument('--large-latency', type=float, default=1.5, help='время до первого токена большой модели, с')
+    parser.add_argument('--token-latency', type=float, default=0.01)
+    parser.add_argument('--repeats', type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
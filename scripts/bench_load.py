@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import sys
+from os import getenv
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from load_data import parallel_load_json_to_db
+
+load_dotenv()
+
+
+async def bench(json_path: str, db_url: str, worker_counts, batch_size: int):
+    results = []
+    for workers in worker_counts:
+        conn = await asyncpg.connect(db_url)
+        try:
+            await conn.execute('TRUNCATE videos, video_snapshots, snapshot_rollup_hourly, snapshot_rollup_daily, ingest_watermarks')
+        finally:
+            await conn.close()
+        totals, elapsed = await parallel_load_json_to_db(
+            json_path, db_url, workers, batch_size, checkpoint_path=f'{json_path}.bench.checkpoint',
+        )
+        rows = totals['videos'] + totals['snapshots']
+        results.append((workers, rows, elapsed))
+
+    base = results[0][1] / results[0][2]
+    print(f'\n{"workers":>7} {"rows":>10} {"seconds":>8} {"rows/sec":>10} {"speedup":>8}')
+    for workers, rows, elapsed in results:
+        print(f'{workers:>7} {rows:>10} {elapsed:>8.1f} {rows / elapsed:>10.0f} {rows / elapsed / base:>7.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Масштабирование загрузки по числу воркеров. ВНИМАНИЕ: очищает videos и video_snapshots, '
+                    'запускать только на одноразовой базе.'
+    )
+    parser.add_argument('json_path', help='файл из scripts/generate_videos.py')
+    parser.add_argument('--workers', default='1,2,4,8', help='список числа воркеров через запятую')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+    db_url = getenv('DATABASE_URL')
+    if not db_url:
+        sys.exit(1)
+    asyncio.run(bench(args.json_path, db_url, [int(w) for w in args.workers.split(',')], args.batch_size))
@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from os import getenv
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import ResultCache, normalize_question
+from columnar import ColumnStore
+from database import Database
+from generate_videos import generate
+from llm_query import LLMQueryBuilder
+from load_data import bulk_load_json_to_db
+from metrics import metrics
+from pipeline import QueryPipeline
+from stub_ollama import StubOllama
+from template_cache import TemplateCache
+
+load_dotenv()
+
+CORPUS_PATH = Path(__file__).resolve().parent / 'accuracy_corpus.json'
+STAGES = ('fixed_match', 'columnar', 'template_lookup', 'llm_build', 'validation', 'sql_rewrite', 'db_execute', 'total')
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def seed(db_url: str, corpus, args):
+    import asyncpg
+
+    conn = await asyncpg.connect(db_url)
+    try:
+        await conn.execute('TRUNCATE videos, video_snapshots, snapshot_rollup_hourly, snapshot_rollup_daily, ingest_watermarks')
+    finally:
+        await conn.close()
+    fd, json_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        start = datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc)
+        generate(json_path, args.videos, args.snapshots, args.creators, start, args.days, args.seed,
+                 corpus['creator_ids'])
+        await bulk_load_json_to_db(json_path, db_url)
+    finally:
+        os.remove(json_path)
+
+
+async def replay(pipeline, question: str):
+    started = time.perf_counter()
+    try:
+        answer, error = int(await pipeline.answer(question)), None
+        path, sql_query = pipeline.trace.get(normalize_question(question), ('error', None))
+    except Exception as e:
+        path, sql_query, answer, error = 'error', None, None, str(e)
+    return {
+        'question': question,
+        'path': path,
+        'sql': sql_query,
+        'answer': answer,
+        'error': error,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def stage_samples(samples):
+    stages = {}
+    for (name, labels), values in samples.items():
+        if name == 'stage_seconds':
+            stages.setdefault(dict(labels)['stage'], []).extend(values)
+        elif name == 'request_seconds':
+            stages.setdefault('total', []).extend(values)
+    return stages
+
+
+def summarize(results, samples, elapsed: float):
+    total = len(results)
+    paths = {}
+    for result in results:
+        paths[result['path']] = paths.get(result['path'], 0) + 1
+    stages = {}
+    collected = stage_samples(samples)
+    for stage in STAGES:
+        values = collected.get(stage)
+        if values:
+            stages[stage] = {
+                'count': len(values),
+                'mean_ms': statistics.mean(values) * 1000,
+                'p50_ms': percentile(values, 0.5) * 1000,
+                'p90_ms': percentile(values, 0.9) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+            }
+    return {
+        'questions': total,
+        'accuracy': sum(result['correct'] for result in results) / total,
+        'fast_path_coverage': (paths.get('fast_path', 0) + paths.get('columnar', 0)) / total,
+        'columnar_coverage': paths.get('columnar', 0) / total,
+        'template_coverage': paths.get('template', 0) / total,
+        'llm_share': paths.get('llm', 0) / total,
+        'errors': paths.get('error', 0),
+        'throughput_qps': total / elapsed,
+        'stages': stages,
+    }
+
+
+def print_report(summary, baseline=None):
+    def compare(value, key, fmt):
+        line = fmt.format(value)
+        if baseline is not None:
+            old = baseline['summary'].get(key)
+            if old is not None:
+                line += f' (было {fmt.format(old)})'
+        return line
+
+    print(f"вопросов {summary['questions']}, точность {compare(summary['accuracy'], 'accuracy', '{:.0%}')}, "
+          f"ошибок {summary['errors']}")
+    print(f"быстрый путь {compare(summary['fast_path_coverage'], 'fast_path_coverage', '{:.0%}')}, "
+          f"из них колоночным движком {compare(summary['columnar_coverage'], 'columnar_coverage', '{:.0%}')}, "
+          f"шаблоны {compare(summary['template_coverage'], 'template_coverage', '{:.0%}')}, "
+          f"LLM {compare(summary['llm_share'], 'llm_share', '{:.0%}')}")
+    print(f"пропускная способность {compare(summary['throughput_qps'], 'throughput_qps', '{:.1f}')} вопросов/с")
+    print(f'\n{"этап":>16} {"n":>5} {"p50, мс":>10} {"p90, мс":>10} {"p99, мс":>10}')
+    for stage, st in summary['stages'].items():
+        old = baseline['summary']['stages'].get(stage) if baseline else None
+        suffix = f"   было p50 {old['p50_ms']:.2f}" if old else ''
+        print(f"{stage:>16} {st['count']:>5} {st['p50_ms']:>10.2f} {st['p90_ms']:>10.2f} {st['p99_ms']:>10.2f}{suffix}")
+
+
+async def main(args):
+    db_url = getenv('DATABASE_URL')
+    if not db_url:
+        sys.exit(1)
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    if args.seed_data:
+        await seed(db_url, corpus, args)
+
+    stub = None
+    if args.ollama_url:
+        ollama_url = args.ollama_url
+    else:
+        responses = {entry['question']: entry.get('llm_sql', entry['reference_sql']) for entry in corpus['questions']}
+        stub = StubOllama(args.llm_latency, responses=responses, token_latency=args.token_latency)
+        ollama_url = await stub.start()
+    llm = LLMQueryBuilder(ollama_url=ollama_url, model=args.model, stream=not args.no_stream)
+    db = Database(db_url)
+    await db.connect()
+    try:
+        expected = {}
+        for entry in corpus['questions']:
+            expected[entry['question']] = int(await db.execute_query(entry['reference_sql']) or 0)
+
+        columnar = None
+        if args.columnar:
+            columnar = ColumnStore()
+            await columnar.refresh(db)
+        size = len(corpus['questions']) * args.repeats
+        pipeline = QueryPipeline(
+            db, llm, TemplateCache(path=None), ResultCache(max_size=0),
+            llm_concurrency=args.llm_concurrency, llm_queue_size=size,
+            db_concurrency=args.db_concurrency, db_queue_size=size,
+            use_rollups=not args.no_rollups, columnar=columnar,
+        )
+        pipeline.trace = {}
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def run(entry):
+            async with semaphore:
+                return await replay(pipeline, entry['question'])
+
+        metrics.samples = {}
+        started = time.perf_counter()
+        results = []
+        for _ in range(args.repeats):
+            results += await asyncio.gather(*(run(entry) for entry in corpus['questions']))
+        elapsed = time.perf_counter() - started
+        samples, metrics.samples = metrics.samples, None
+    finally:
+        await db.close()
+        await llm.close()
+        if stub:
+            await stub.stop()
+
+    for result in results:
+        result['expected'] = expected[result['question']]
+        result['correct'] = result['answer'] == result['expected']
+    summary = summarize(results, samples, elapsed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+    for result in results[:len(corpus['questions'])]:
+        if not result['correct']:
+            print(f"\nНЕВЕРНО [{result['path']}] {result['question']}\n  ответ {result['answer']}, "
+                  f"ожидалось {result['expected']}{', ' + result['error'] if result['error'] else ''}\n  {result['sql']}")
+
+    if args.output:
+        report = {
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'summary': summary,
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1, default=str)
+    if baseline and summary['accuracy'] < baseline['summary']['accuracy']:
+        print('\nточность ниже базовой')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Офлайн-прогон корпуса вопросов через правила, LLM (заглушка или Ollama), исправление SQL и БД: '
+                    'латентность этапов, покрытие быстрым путём и точность ответов. С --seed-data очищает таблицы, '
+                    'запускать только на одноразовой базе.'
+    )
+    parser.add_argument('--corpus', default=str(CORPUS_PATH))
+    parser.add_argument('--output', help='записать отчёт в JSON')
+    parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения; код 1, если точность упала')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=1, help='одновременных вопросов')
+    parser.add_argument('--llm-concurrency', type=int, default=1, help='как LLM_CONCURRENCY в боте')
+    parser.add_argument('--db-concurrency', type=int, default=5, help='как DB_CONCURRENCY в боте')
+    parser.add_argument('--ollama-url', help='реальная Ollama; без него используется заглушка')
+    parser.add_argument('--model', default='gemma3:4b')
+    parser.add_argument('--no-stream', action='store_true')
+    parser.add_argument('--no-rollups', action='store_true')
+    parser.add_argument('--columnar', action='store_true', help='отвечать на быстрый путь колоночным движком')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='время до первого токена заглушки, с')
+    parser.add_argument('--token-latency', type=float, default=0.01)
+    parser.add_argument('--seed-data', action='store_true', help='сгенерировать и загрузить данные для корпуса')
+    parser.add_argument('--videos', type=int, default=3000)
+    parser.add_argument('--snapshots', type=int, default=72)
+    parser.add_argument('--creators', type=int, default=50)
+    parser.add_argument('--start', default='2025-06-01')
+    parser.add_argument('--days', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_query import SCHEMA_DESCRIPTION, SYSTEM_MESSAGE, TASK_DESCRIPTION, LLMQueryBuilder
+from stub_ollama import StubOllama
+
+QUESTIONS = [
+    'Сколько всего видео есть в системе?',
+    'Сколько видео набрало больше 100 000 просмотров за всё время?',
+    'На сколько просмотров в сумме выросли все видео 28 ноября 2025?',
+    'Сколько видео у креатора с id aca1061a9d324ecf8c3fa2bb32d7be63 вышло с 1 по 5 ноября 2025?',
+    'Сколько разных видео получали новые просмотры 27 ноября 2025?',
+    'Какое суммарное количество лайков у видео, опубликованных в июне 2025?',
+    'Сколько всего есть замеров статистики, в которых число просмотров за час оказалось отрицательным?',
+    'Сколько видео опубликовано в октябре 2025?',
+]
+
+
+class LegacyPromptBuilder(LLMQueryBuilder):
+    def payload(self, user_query: str, stream: bool, model: str = None):
+        payload = super().payload(user_query, stream, model)
+        payload['messages'] = [
+            {'role': 'system', 'content': SYSTEM_MESSAGE},
+            {'role': 'user', 'content': f'{SCHEMA_DESCRIPTION}\n\n---\n\nВопрос пользователя: "{user_query}"\n\n'
+                                        f'{TASK_DESCRIPTION}'},
+        ]
+        return payload
+
+
+async def run(builder, repeats: int):
+    latencies = []
+    try:
+        for _ in range(repeats):
+            for question in QUESTIONS:
+                await builder.build_query(question)
+                latencies.append(builder.last_stats['seconds'])
+    finally:
+        await builder.close()
+    return latencies, builder.timings
+
+
+async def main(args):
+    stub = StubOllama(args.latency, token_latency=args.token_latency, prompt_latency=args.prompt_latency)
+    url = await stub.start()
+    try:
+        report = {}
+        for cache, keep_alive in (('кэш', '30m'), ('без кэша', '0')):
+            report[f'прежний промпт, {cache}'] = await run(
+                LegacyPromptBuilder(url, 'stub', keep_alive=keep_alive), args.repeats)
+            report[f'стабильный префикс, {cache}'] = await run(
+                LLMQueryBuilder(url, 'stub', keep_alive=keep_alive), args.repeats)
+            report[f'компактная схема, {cache}'] = await run(
+                LLMQueryBuilder(url, 'stub', keep_alive=keep_alive, compact_schema=True), args.repeats)
+    finally:
+        await stub.stop()
+
+    for name, (latencies, timings) in report.items():
+        calls = timings['eval_calls']
+        print(f'{name:>28}: медиана {statistics.median(latencies) * 1000:6.0f} мс, '
+              f'prompt eval {timings["prompt_eval_seconds"] / calls * 1000:6.0f} мс '
+              f'({timings["prompt_eval_count"] / calls:5.0f} ток.), '
+              f'eval {timings["eval_seconds"] / calls * 1000:5.0f} мс на вызов')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Время обработки промпта: прежняя раскладка, стабильный префикс схемы и компактная схема, '
+                    'с кэшем контекста Ollama (keep_alive) и без него'
+    )
+    parser.add_argument('--latency', type=float, default=0.05, help='постоянная задержка заглушки, с')
+    parser.add_argument('--prompt-latency', type=float, default=0.2, help='время на 1000 символов вне кэша, с')
+    parser.add_argument('--token-latency', type=float, default=0.01, help='время на токен ответа, с')
+    parser.add_argument('--repeats', type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
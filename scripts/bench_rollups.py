@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from os import getenv
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from load_data import refresh_rollups
+from partitions import ensure_partitions
+from rollups import route_to_rollups
+
+load_dotenv()
+
+GENERATE_VIDEOS_SQL = """
+    INSERT INTO videos (id, creator_id, video_created_at)
+    SELECT md5('video' || i)::uuid, md5('creator' || (i % $2)), $3::timestamptz + (i % $4) * interval '1 day'
+    FROM generate_series(1, $1) AS i
+"""
+
+GENERATE_SNAPSHOTS_SQL = """
+    INSERT INTO video_snapshots (id, video_id, delta_views_count, delta_likes_count, created_at)
+    SELECT 's' || i, md5('video' || (i % $2 + 1))::uuid,
+           abs(hashint4(i)) % 200 - 5, abs(hashint4(i + 1)) % 10,
+           $3::timestamptz + (i % ($4 * 24)) * interval '1 hour' + (i % 60) * interval '1 minute'
+    FROM generate_series(1, $1) AS i
+"""
+
+
+def queries(creator_id: str, start: date, days: int):
+    day = start + timedelta(days=days // 2)
+    return {
+        'прирост креатора за часы': (
+            "SELECT COALESCE(SUM(vs.delta_views_count), 0) FROM video_snapshots vs "
+            "JOIN videos v ON vs.video_id = v.id WHERE v.creator_id = $1::text "
+            "AND DATE(vs.created_at) = $2::date "
+            "AND EXTRACT(HOUR FROM vs.created_at) >= $3::int AND EXTRACT(HOUR FROM vs.created_at) < $4::int",
+            [creator_id, day, 10, 15],
+        ),
+        'прирост лайков за неделю': (
+            "SELECT SUM(delta_likes_count) FROM video_snapshots WHERE DATE(created_at) BETWEEN $1::date AND $2::date",
+            [day, day + timedelta(days=6)],
+        ),
+        'отрицательные замеры': ("SELECT COUNT(*) FROM video_snapshots WHERE delta_views_count < 0", []),
+        'замеры креатора': (
+            "SELECT COUNT(*) FROM video_snapshots vs JOIN videos v ON vs.video_id = v.id WHERE v.creator_id = $1::text",
+            [creator_id],
+        ),
+    }
+
+
+async def timed(conn, sql_query, args, repeats):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = await conn.fetchval(sql_query, *args)
+        latencies.append(time.perf_counter() - started)
+    return result, statistics.median(latencies)
+
+
+async def bench(db_url: str, args):
+    conn = await asyncpg.connect(db_url, server_settings={'timezone': 'UTC'})
+    try:
+        start = date.fromisoformat(args.start)
+        if not args.skip_generate:
+            started = time.perf_counter()
+            await conn.execute('TRUNCATE videos, video_snapshots, snapshot_rollup_hourly, snapshot_rollup_daily, ingest_watermarks')
+            await conn.execute(GENERATE_VIDEOS_SQL, args.videos, args.creators, start, args.days)
+            first = datetime.combine(start, datetime.min.time(), timezone.utc)
+            await ensure_partitions(conn, first, first + timedelta(days=args.days))
+            await conn.execute(GENERATE_SNAPSHOTS_SQL, args.snapshots, args.videos, start, args.days)
+            await conn.execute('ANALYZE videos, video_snapshots')
+            print(f'сгенерировано {args.snapshots} замеров за {time.perf_counter() - started:.1f}s')
+
+            started = time.perf_counter()
+            loaded_range = await conn.fetchrow('SELECT MIN(created_at), MAX(created_at) FROM video_snapshots')
+            await refresh_rollups(conn, tuple(loaded_range))
+            await conn.execute('ANALYZE snapshot_rollup_hourly, snapshot_rollup_daily')
+            print(f'агрегаты построены за {time.perf_counter() - started:.1f}s')
+
+        creator_id = await conn.fetchval('SELECT creator_id FROM videos LIMIT 1')
+        print(f'\n{"запрос":>26} {"сырые, мс":>10} {"агрегаты, мс":>13} {"ускорение":>10}')
+        for name, (sql_query, query_args) in queries(creator_id, start, args.days).items():
+            routed = route_to_rollups(sql_query)
+            raw_result, raw_time = await timed(conn, sql_query, query_args, args.repeats)
+            routed_result, routed_time = await timed(conn, routed, query_args, args.repeats)
+            status = '' if (raw_result or 0) == routed_result else f'  РАСХОЖДЕНИЕ: {raw_result} != {routed_result}'
+            print(f'{name:>26} {raw_time * 1000:>10.1f} {routed_time * 1000:>13.2f} '
+                  f'{raw_time / routed_time:>9.0f}x{status}')
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Латентность запросов к video_snapshots напрямую и через агрегаты. ВНИМАНИЕ: очищает '
+                    'videos и video_snapshots, запускать только на одноразовой базе.'
+    )
+    parser.add_argument('--snapshots', type=int, default=50_000_000)
+    parser.add_argument('--videos', type=int, default=100_000)
+    parser.add_argument('--creators', type=int, default=1000)
+    parser.add_argument('--start', default='2025-08-01')
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--skip-generate', action='store_true', help='использовать уже сгенерированные данные')
+    args = parser.parse_args()
+    db_url = getenv('DATABASE_URL')
+    if not db_url:
+        sys.exit(1)
+    asyncio.run(bench(db_url, args))
@@ -0,0 +1,49 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import legacy_rules
+import sql_rules
+
+SAMPLE_SQL = "SELECT COUNT(*) FROM videos WHERE creator_id = 'x' AND DATE(video_created_at) BETWEEN '2025-01-01' AND '2025-01-02'"
+
+
+def bench(label, func, questions, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for question in questions:
+            func(question)
+    per_message = (time.perf_counter() - started) / (rounds * len(questions))
+    print(f'{label:>34}: {per_message * 1e6:8.2f} мкс/сообщение')
+    return per_message
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Стоимость сопоставления правил на сообщение: старая цепочка regex и таблица правил')
+    parser.add_argument('--corpus', default=str(Path(__file__).resolve().parent / 'questions.txt'))
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+    questions = [line.strip() for line in open(args.corpus, encoding='utf-8') if line.strip()]
+
+    fallback = [q for q in questions if not sql_rules.match_rule(q)]
+    matched = [q for q in questions if sql_rules.match_rule(q)]
+    legacy_covered = sum(1 for q in questions if legacy_rules.get_fixed_sql_for_question(q))
+    print(f'быстрый путь: было {legacy_covered}, стало {len(matched)} из {len(questions)} вопросов')
+
+    for label, subset in (('все вопросы', questions), ('без совпадения (уходят в LLM)', fallback),
+                          ('с совпадением правила', matched)):
+        if not subset:
+            continue
+        print(f'\n{label}, {len(subset)} шт.:')
+        old_fixed = bench('get_fixed_sql_for_question (было)', legacy_rules.get_fixed_sql_for_question, subset, args.rounds)
+        new_fixed = bench('get_fixed_sql_for_question (стало)', sql_rules.get_fixed_sql_for_question, subset, args.rounds)
+        bench('без кэша извлечения (стало)', lambda q: sql_rules.fixed_rules.match(
+            sql_rules.Values(user_query=q, q=q.lower())), subset, args.rounds)
+        old_fix = bench('validate_and_fix_sql (было)', lambda q: legacy_rules.validate_and_fix_sql(SAMPLE_SQL, q), subset, args.rounds)
+        new_fix = bench('validate_and_fix_sql (стало)', lambda q: sql_rules.validate_and_fix_sql(SAMPLE_SQL, q), subset, args.rounds)
+        print(f'{"ускорение":>34}: get_fixed_sql_for_question x{old_fixed / new_fixed:.2f}, '
+              f'validate_and_fix_sql x{old_fix / new_fix:.2f}')
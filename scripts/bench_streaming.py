@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_query import LLMQueryBuilder
+from stub_ollama import StubOllama
+
+EXPLANATION = (
+    'Этот запрос считает нужное значение по таблице. Мы используем агрегатную функцию, '
+    'потому что вопрос требует одно число, а фильтр ограничивает выборку нужным периодом. '
+    'Если потребуется, запрос можно расширить дополнительными условиями по креатору или датам. '
+) * 3
+
+CANNED = {
+    'Сколько всего видео есть в системе?': (
+        f'```sql\nSELECT COUNT(*) FROM videos;\n```\n\n{EXPLANATION}',
+        'SELECT COUNT(*) FROM videos',
+    ),
+    'Сколько просмотров набрали видео, опубликованные в ноябре 2025?': (
+        "SELECT SUM(views_count) FROM videos WHERE DATE(video_created_at) BETWEEN '2025-11-01' AND '2025-11-30'"
+        f'\n\nПояснение: {EXPLANATION}',
+        "SELECT SUM(views_count) FROM videos WHERE DATE(video_created_at) BETWEEN '2025-11-01' AND '2025-11-30'",
+    ),
+    'Сколько видео у креатора с id aca1061a9d324ecf8c3fa2bb32d7be63 набрали больше 10000 просмотров?': (
+        "```sql\nSELECT COUNT(*)\nFROM videos\nWHERE creator_id = 'aca1061a9d324ecf8c3fa2bb32d7be63'\n"
+        f"  AND views_count > 10000\n```\n{EXPLANATION}",
+        "SELECT COUNT(*)\nFROM videos\nWHERE creator_id = 'aca1061a9d324ecf8c3fa2bb32d7be63'\n  AND views_count > 10000",
+    ),
+    'Сколько замеров с отрицательным приростом просмотров?': (
+        'SELECT COUNT(*) FROM video_snapshots WHERE delta_views_count < 0',
+        'SELECT COUNT(*) FROM video_snapshots WHERE delta_views_count < 0',
+    ),
+}
+
+
+async def run(url: str, stub: StubOllama, stream: bool, repeats: int):
+    llm = LLMQueryBuilder(ollama_url=url, model='stub', stream=stream)
+    stub.tokens_generated = stub.tokens_total = 0
+    latencies, wrong = [], 0
+    try:
+        for _ in range(repeats):
+            for question, (_, expected) in CANNED.items():
+                sql_query = await llm.build_query(question)
+                latencies.append(llm.last_stats['seconds'])
+                wrong += sql_query != expected
+    finally:
+        await llm.close()
+    await asyncio.sleep(0.1)
+    return latencies, stub.tokens_generated, stub.tokens_total, wrong
+
+
+async def main(args):
+    stub = StubOllama(args.latency, responses={q: response for q, (response, _) in CANNED.items()},
+                      token_latency=args.token_latency)
+    url = await stub.start()
+    try:
+        report = {
+            'без стриминга': await run(url, stub, False, args.repeats),
+            'стриминг': await run(url, stub, True, args.repeats),
+        }
+    finally:
+        await stub.stop()
+
+    for name, (latencies, generated, total, wrong) in report.items():
+        print(f'{name:>14}: медиана {statistics.median(latencies) * 1000:7.0f} мс, '
+              f'максимум {max(latencies) * 1000:7.0f} мс, сгенерировано токенов {generated}/{total}, '
+              f'неверных SQL {wrong}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Время до SQL и число сгенерированных токенов с ранней остановкой стрима и без неё'
+    )
+    parser.add_argument('--latency', type=float, default=0.3, help='время до первого токена заглушки, с')
+    parser.add_argument('--token-latency', type=float, default=0.02, help='время на токен, с')
+    parser.add_argument('--repeats', type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
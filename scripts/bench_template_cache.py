@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import calendar
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_query import LLMQueryBuilder
+from template_cache import TemplateCache
+
+MONTHS_GEN = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля',
+              'августа', 'сентября', 'октября', 'ноября', 'декабря']
+MONTHS_PREP = ['январе', 'феврале', 'марте', 'апреле', 'мае', 'июне', 'июле',
+               'августе', 'сентябре', 'октябре', 'ноябре', 'декабре']
+
+
+def random_question(rng: random.Random):
+    cid = f'{rng.getrandbits(128):032x}'
+    month = rng.randrange(12)
+    day1 = rng.randint(1, 14)
+    day2 = rng.randint(day1 + 1, 28)
+    h1 = rng.randint(2, 12)
+    h2 = rng.randint(h1 + 1, 23)
+    threshold = rng.choice([5000, 10000, 50000, 100000])
+    kind = rng.randrange(4)
+    if kind == 0:
+        return (
+            f'Сколько видео у креатора с id {cid} вышло с {day1} {MONTHS_GEN[month]} 2025 '
+            f'по {day2} {MONTHS_GEN[month]} 2025 включительно?',
+            f"SELECT COUNT(*) FROM videos WHERE creator_id = '{cid}' AND DATE(video_created_at) "
+            f"BETWEEN '2025-{month + 1:02d}-{day1:02d}' AND '2025-{month + 1:02d}-{day2:02d}'",
+        )
+    if kind == 1:
+        return (
+            f'На сколько просмотров суммарно выросли все видео креатора с id {cid} '
+            f'{day1} {MONTHS_GEN[month]} 2025 с {h1}:00 до {h2}:00?',
+            f"SELECT SUM(vs.delta_views_count) FROM video_snapshots vs JOIN videos v ON vs.video_id = v.id "
+            f"WHERE v.creator_id = '{cid}' AND DATE(vs.created_at) = '2025-{month + 1:02d}-{day1:02d}' "
+            f"AND EXTRACT(HOUR FROM vs.created_at) >= {h1} AND EXTRACT(HOUR FROM vs.created_at) < {h2}",
+        )
+    if kind == 2:
+        return (
+            f'Сколько видео набрало больше {threshold:,} просмотров за всё время?'.replace(',', ' '),
+            f'SELECT COUNT(*) FROM videos WHERE views_count > {threshold}',
+        )
+    return (
+        f'Сколько лайков в сумме получили видео, опубликованные в {MONTHS_PREP[month]} 2025?',
+        f"SELECT SUM(likes_count) FROM videos WHERE DATE(video_created_at) "
+        f"BETWEEN '2025-{month + 1:02d}-01' AND '2025-{month + 1:02d}-{calendar.monthrange(2025, month + 1)[1]}'",
+    )
+
+
+class SimulatedLLM:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.answers = {}
+
+    async def build_query(self, user_query: str) -> str:
+        await asyncio.sleep(self.latency)
+        return self.answers[user_query]
+
+    async def close(self):
+        pass
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(llm, questions, cache):
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        if cache is None or cache.lookup(question) is None:
+            sql_query = await llm.build_query(question)
+            if cache is not None:
+                cache.store(question, sql_query)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    corpus = [random_question(rng) for _ in range(args.questions)]
+    if args.ollama_url:
+        llm = LLMQueryBuilder(ollama_url=args.ollama_url, model=args.model)
+    else:
+        llm = SimulatedLLM(args.llm_latency)
+        llm.answers = dict(corpus)
+    questions = [question for question, _ in corpus]
+
+    try:
+        report = {}
+        report['без кэша'] = (await run(llm, questions, None), None)
+        cache = TemplateCache(path=None)
+        report['с кэшем шаблонов'] = (await run(llm, questions, cache), cache.stats())
+    finally:
+        await llm.close()
+
+    for name, (latencies, stats) in report.items():
+        line = (f'{name:>18}: p50 {percentile(latencies, 0.5) * 1000:8.2f} мс, '
+                f'p99 {percentile(latencies, 0.99) * 1000:8.2f} мс, '
+                f'среднее {statistics.mean(latencies) * 1000:8.2f} мс')
+        if stats:
+            line += f", попаданий {stats['hit_rate']:.0%}, шаблонов {stats['size']}"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Латентность вопрос → SQL с кэшем шаблонов и без него')
+    parser.add_argument('--questions', type=int, default=200)
+    parser.add_argument('--ollama-url', help='реальная Ollama; без него LLM симулируется задержкой')
+    parser.add_argument('--model', default='gemma3:4b')
+    parser.add_argument('--llm-latency', type=float, default=2.0, help='задержка симулированной LLM, с')
+    parser.add_argument('--seed', type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
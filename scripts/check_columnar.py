@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import calendar
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from os import getenv
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from columnar import EPOCH, ColumnStore
+from database import Database
+from sql_rules import FIXED_RULES
+
+load_dotenv()
+
+
+def sample_values(store: ColumnStore, rng: random.Random):
+    hours = store.hour if len(store.hour) else store.video_hour
+    first = EPOCH + timedelta(hours=int(hours.min()))
+    last = EPOCH + timedelta(hours=int(hours.max()))
+    day = first + timedelta(days=rng.randint(0, (last - first).days))
+    start = first + timedelta(days=rng.randint(0, (last - first).days))
+    month_start = date(day.year, day.month, 1)
+    hour_from = rng.randint(0, 23)
+    return {
+        'creator_id': rng.choice(store.creators) if rng.random() < 0.95 else 'f' * 32,
+        'date': day,
+        'hours': (hour_from, rng.randint(hour_from, 24)),
+        'month': (
+            month_start,
+            date(day.year, day.month, calendar.monthrange(day.year, day.month)[1]),
+            date(day.year + day.month // 12, day.month % 12 + 1, 1),
+        ),
+        'threshold': int(rng.choice(store.video_views)) if len(store.video_views) else 0,
+        'period': tuple(sorted((day, start))),
+    }
+
+
+async def cross_check(db: Database, store: ColumnStore, samples: int, rng: random.Random):
+    mismatches = 0
+    async with db.pool.acquire() as conn:
+        for rule in FIXED_RULES:
+            engine_times, sql_times = [], []
+            for _ in range(samples):
+                sql, args = rule.build(sample_values(store, rng))
+                started = time.perf_counter()
+                expected = await conn.fetchval(sql, *args)
+                sql_times.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                result = store.answer(rule.name, args, store.version)
+                engine_times.append(time.perf_counter() - started)
+                if (None if expected is None else int(expected)) != result:
+                    mismatches += 1
+                    print(f'НЕ СОВПАДАЕТ {rule.name}{tuple(args)}: SQL {expected}, движок {result}')
+            print(f'{rule.name:>28}: движок {statistics.median(engine_times) * 1e6:8.1f} мкс, '
+                  f'SQL {statistics.median(sql_times) * 1000:8.2f} мс')
+    return mismatches
+
+
+async def main(args):
+    db_url = getenv('DATABASE_URL')
+    if not db_url:
+        sys.exit(1)
+    db = Database(db_url)
+    await db.connect()
+    store = ColumnStore()
+    rng = random.Random(args.seed)
+    try:
+        await store.refresh(db)
+        st = store.stats()
+        print(f"загружено: креаторов {st['creators']}, видео {st['videos']}, часов {st['hours']}, "
+              f"{st['bytes'] / 2 ** 20:.1f} МБ за {st['refresh_seconds']:.2f} с")
+        mismatches = await cross_check(db, store, args.samples, rng)
+        await store.refresh(db)
+        st = store.stats()
+        print(f"повторное обновление: {'инкрементальное' if st['incremental_refreshes'] else 'полное'}, "
+              f"{st['refresh_seconds']:.2f} с")
+        mismatches += await cross_check(db, store, args.samples, rng)
+    finally:
+        await db.close()
+    print(f'расхождений: {mismatches}')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Сверка колоночного движка с SQL по всем правилам быстрого пути на случайных параметрах '
+                    '(база из DATABASE_URL); код 1 при расхождениях'
+    )
+    parser.add_argument('--samples', type=int, default=200, help='случайных наборов параметров на правило')
+    parser.add_argument('--seed', type=int, default=1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import json
+import re
+import sys
+from datetime import timedelta
+from os import getenv
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_query import SCHEMA_DESCRIPTION
+from sargable import rewrite_sargable
+
+load_dotenv()
+
+TEMPLATE_RE = re.compile(r'^- (?P<name>[^:]+): `(?P<sql>[^`]+)`(?P<hint>.*)$', re.MULTILINE)
+INDEX_NODES = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+def prompt_templates():
+    section = SCHEMA_DESCRIPTION.split('## 5. Краткие шаблоны', 1)[1]
+    for m in TEMPLATE_RE.finditer(section):
+        yield m.group('name'), m.group('sql')
+        if 'WHERE' in m.group('hint') and 'WHERE' not in m.group('sql'):
+            yield (f"{m.group('name')} + период",
+                   f"{m.group('sql')} WHERE DATE(video_created_at) BETWEEN 'Y-M-D' AND 'Y-M-D'")
+
+
+def fill(sql_query: str, creator_id: str, day, hours, threshold: int):
+    dates = iter([day, day + timedelta(days=6)])
+    sql_query = re.sub(r"'Y-M-D'", lambda m: f"'{next(dates, day).isoformat()}'", sql_query)
+    sql_query = sql_query.replace("'ID'", f"'{creator_id}'")
+    sql_query = re.sub(r'\bH1\b', str(hours[0]), sql_query)
+    sql_query = re.sub(r'\bH2\b', str(hours[1]), sql_query)
+    return re.sub(r'\bN\b', str(threshold), sql_query)
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+async def explain(conn, sql_query: str):
+    plan = json.loads(await conn.fetchval(f'EXPLAIN (FORMAT JSON) {sql_query}'))[0]['Plan']
+    nodes = list(plan_nodes(plan))
+    indexes = sorted({node['Index Name'] for node in nodes if node['Node Type'] in INDEX_NODES})
+    seq_scans = sorted({node['Relation Name'] for node in nodes if node['Node Type'] == 'Seq Scan'})
+    empty = set(await conn.fetchval(
+        'SELECT array_agg(relname::text) FROM pg_class WHERE relname = ANY($1::text[]) AND relpages = 0', seq_scans
+    ) or [])
+    partitions = {node['Relation Name'] for node in nodes if node.get('Relation Name', '').startswith('video_snapshots_')}
+    return indexes, [name for name in seq_scans if name not in empty], len(partitions)
+
+
+def describe(indexes, seq_scans, partitions):
+    parts = [f'index {name}' for name in indexes] + [f'seq scan {name}' for name in seq_scans]
+    if partitions:
+        parts.append(f'секций video_snapshots: {partitions}')
+    return ', '.join(parts)
+
+
+async def check(db_url: str, args):
+    conn = await asyncpg.connect(db_url, server_settings={'timezone': 'UTC'})
+    try:
+        creator_id = await conn.fetchval('SELECT creator_id FROM videos LIMIT 1')
+        day = await conn.fetchval('SELECT DATE(MAX(created_at)) FROM video_snapshots')
+        if creator_id is None or day is None:
+            print('База пуста: загрузите данные (например, scripts/bench_rollups.py) и выполните ANALYZE')
+            return 1
+        failures = 0
+        for name, template in prompt_templates():
+            sql_query = fill(template, creator_id, day - timedelta(days=7), (10, 15), args.threshold)
+            before = await explain(conn, sql_query)
+            after = await explain(conn, rewrite_sargable(sql_query))
+            filtered = 'WHERE' in sql_query.upper()
+            ok = not filtered or (after[0] and not after[1])
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+            print(f'     как есть:     {describe(*before)}')
+            print(f'     после правки: {describe(*after)}')
+            if not filtered:
+                print('     (без фильтра — полный проход допустим)')
+        print(f'\nпроверено шаблонов: {len(list(prompt_templates()))}, без индексного плана: {failures}')
+        return 1 if failures else 0
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='EXPLAIN для каждого шаблона из раздела «Краткие шаблоны» промпта после sargable-переписывания: '
+                    'запрос с фильтром должен использовать индекс без seq scan'
+    )
+    parser.add_argument('--threshold', type=int, default=100000, help='значение N в шаблонах')
+    args = parser.parse_args()
+    db_url = getenv('DATABASE_URL')
+    if not db_url:
+        sys.exit(1)
+    sys.exit(asyncio.run(check(db_url, args)))
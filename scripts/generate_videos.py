@@ -0,0 +1,73 @@
+import argparse
+import json
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+
+def iso(ts: datetime) -> str:
+    return ts.isoformat().replace('+00:00', 'Z')
+
+
+def generate_video(rng: random.Random, creators, start: datetime, days: int, snapshots: int):
+    published = start + timedelta(hours=rng.randrange(days * 24))
+    counts = {'views_count': 0, 'likes_count': 0, 'comments_count': 0, 'reports_count': 0}
+    growth = rng.choice([5, 50, 500, 5000])
+    snapshot_list = []
+    for hour in range(1, snapshots + 1):
+        deltas = {
+            'views_count': max(-3, int(rng.expovariate(1 / growth)) - 2),
+            'likes_count': int(rng.expovariate(10 / growth)),
+            'comments_count': int(rng.expovariate(100 / growth)),
+            'reports_count': 1 if rng.random() < 0.001 else 0,
+        }
+        for key, delta in deltas.items():
+            counts[key] = max(0, counts[key] + delta)
+        taken = iso(published + timedelta(hours=hour))
+        snapshot_list.append({
+            'id': uuid.UUID(int=rng.getrandbits(128)).hex,
+            **counts,
+            **{f'delta_{key}': delta for key, delta in deltas.items()},
+            'created_at': taken,
+            'updated_at': taken,
+        })
+    return {
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'creator_id': rng.choice(creators),
+        'video_created_at': iso(published),
+        **counts,
+        'created_at': iso(published),
+        'updated_at': snapshot_list[-1]['updated_at'] if snapshot_list else iso(published),
+        'snapshots': snapshot_list,
+    }
+
+
+def generate(path: str, videos: int, snapshots: int, creators: int, start: datetime, days: int, seed: int,
+             fixed_creator_ids=()):
+    rng = random.Random(seed)
+    creator_ids = [f'{rng.getrandbits(128):032x}' for _ in range(creators)]
+    creator_ids[:len(fixed_creator_ids)] = fixed_creator_ids
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"videos": [\n')
+        for idx in range(videos):
+            if idx:
+                f.write(',\n')
+            json.dump(generate_video(rng, creator_ids, start, days, snapshots), f, ensure_ascii=False)
+        f.write('\n]}\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Синтетический videos.json в формате выгрузки для загрузки и бенчмарков')
+    parser.add_argument('path', nargs='?', default='videos.json')
+    parser.add_argument('--videos', type=int, default=10000)
+    parser.add_argument('--snapshots', type=int, default=72, help='почасовых замеров на видео')
+    parser.add_argument('--creators', type=int, default=200)
+    parser.add_argument('--start', default='2025-11-01', help='начало периода публикаций (YYYY-MM-DD, UTC)')
+    parser.add_argument('--days', type=int, default=30, help='длина периода публикаций в днях')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--creator-ids', default='', help='id креаторов через запятую, которые должны быть в данных')
+    args = parser.parse_args()
+    start = datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc)
+    fixed_creator_ids = [cid for cid in args.creator_ids.split(',') if cid]
+    generate(args.path, args.videos, args.snapshots, args.creators, start, args.days, args.seed, fixed_creator_ids)
+    print(f'{args.videos} videos, {args.videos * args.snapshots} snapshots -> {args.path}')
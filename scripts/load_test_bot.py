@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stub_ollama import StubOllama
+
+FAST_QUESTION = 'Сколько замеров статистики, в которых число просмотров за час оказалось отрицательным?'
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.sent_at = time.perf_counter()
+        self.reply = None
+        self.latency = None
+
+    async def answer(self, text: str, **kwargs):
+        self.reply = text
+        self.latency = time.perf_counter() - self.sent_at
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def make_questions(args, rng: random.Random):
+    questions = []
+    for i in range(args.messages):
+        roll = rng.random()
+        if roll < args.fast_share:
+            questions.append(FAST_QUESTION)
+        elif roll < args.fast_share + args.duplicate_share and i:
+            questions.append(f'Сколько всего видео есть в системе? Вопрос №{rng.randrange(max(2, i // 10)) + 2}')
+        else:
+            questions.append(f'Сколько всего видео есть в системе? Вопрос №{args.messages + i + 2}')
+    return questions
+
+
+async def main(args):
+    stub = StubOllama(args.llm_latency, args.llm_parallel)
+    os.environ['OLLAMA_URL'] = await stub.start()
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA')
+    os.environ['TEMPLATE_CACHE_PATH'] = ''
+    for name in ('LLM_CONCURRENCY', 'LLM_QUEUE_SIZE', 'DB_CONCURRENCY', 'DB_QUEUE_SIZE'):
+        value = getattr(args, name.lower())
+        if value is not None:
+            os.environ[name] = str(value)
+
+    import bot
+
+    await bot.db.connect()
+    try:
+        rng = random.Random(args.seed)
+        messages = [FakeMessage(question) for question in make_questions(args, rng)]
+        started = time.perf_counter()
+        tasks = []
+        for message in messages:
+            message.sent_at = time.perf_counter()
+            tasks.append(asyncio.create_task(bot.query_handler(message)))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    finally:
+        await bot.db.close()
+        await bot.llm.close()
+        await stub.stop()
+
+    busy = [m for m in messages if m.reply and m.reply.startswith('Сейчас много')]
+    failed = [m for m in messages if m.reply and m.reply.startswith('Произошла ошибка')]
+    answered = [m for m in messages if m not in busy and m not in failed]
+    latencies = [m.latency for m in answered]
+    stats = bot.pipeline.stats()
+    print(f'сообщений {len(messages)} за {elapsed:.1f} с: ответов {len(answered)}, '
+          f'«занято» {len(busy)}, ошибок {len(failed)}')
+    print(f'пропускная способность {len(answered) / elapsed:.1f} ответов/с')
+    print(f'латентность ответа: p50 {percentile(latencies, 0.5) * 1000:.0f} мс, '
+          f'p95 {percentile(latencies, 0.95) * 1000:.0f} мс, p99 {percentile(latencies, 0.99) * 1000:.0f} мс')
+    print(f'вызовов LLM {stub.calls}, объединено одинаковых вопросов {stats["coalesced"]}')
+    for stage in ('llm', 'db'):
+        st = stats[stage]
+        print(f'{stage}: параллельно {st["concurrency"]}, очередь {st["queue_size"]}, '
+              f'макс. ожидающих {st["max_waiting"]}, среднее ожидание {st["avg_wait"] * 1000:.0f} мс, '
+              f'отказов {st["rejected"]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный тест query_handler: поддельные сообщения, заглушка Ollama, реальная база из DATABASE_URL'
+    )
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=20.0, help='сообщений в секунду (пуассоновский поток)')
+    parser.add_argument('--fast-share', type=float, default=0.3, help='доля вопросов, закрываемых правилами')
+    parser.add_argument('--duplicate-share', type=float, default=0.3, help='доля повторяющихся вопросов')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='время одной генерации заглушки, с')
+    parser.add_argument('--llm-parallel', type=int, default=1, help='генераций одновременно в заглушке')
+    parser.add_argument('--llm-concurrency', type=int)
+    parser.add_argument('--llm-queue-size', type=int)
+    parser.add_argument('--db-concurrency', type=int)
+    parser.add_argument('--db-queue-size', type=int)
+    parser.add_argument('--seed', type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
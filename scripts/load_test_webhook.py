@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from stub_ollama import StubOllama
+
+TOKEN = '123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+CORPUS_PATH = Path(__file__).resolve().parent / 'accuracy_corpus.json'
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.replies = {}
+        self.webhooks = []
+        self.runner = None
+
+    async def method(self, request):
+        name = request.match_info['method']
+        data = dict(await request.post())
+        if name == 'setWebhook':
+            self.webhooks.append(data.get('url'))
+            return web.json_response({'ok': True, 'result': True})
+        if name == 'sendMessage':
+            chat_id = int(data['chat_id'])
+            self.replies[chat_id] = (time.perf_counter(), data.get('text', ''))
+            return web.json_response({'ok': True, 'result': {
+                'message_id': chat_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'}, 'text': data.get('text', ''),
+            }})
+        return web.json_response({'ok': True, 'result': True})
+
+    async def start(self, port: int = 0):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.method)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', port).start()
+        return f'http://127.0.0.1:{self.runner.addresses[0][1]}'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def make_questions(count: int, creator_ids, llm_share: float, rng: random.Random):
+    questions = []
+    for i in range(count):
+        if rng.random() < llm_share:
+            questions.append(f'Сколько всего видео есть в системе? Вопрос №{i}')
+        elif i % 2:
+            questions.append(f'Сколько разных креаторов имеют видео с просмотрами больше {rng.randrange(1000, 10 ** 6)}?')
+        else:
+            questions.append(f'Сколько видео креатора с id {rng.choice(creator_ids)} набрали больше '
+                             f'{rng.randrange(1000, 10 ** 6)} просмотров?')
+    return questions
+
+
+def update(update_id: int, chat_id: int, text: str):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'load'},
+        },
+    }
+
+
+async def post_all(session, url, telegram, questions, first_chat: int, concurrency: int, timeout: float):
+    semaphore = asyncio.Semaphore(concurrency)
+    sent = {}
+
+    async def post(i, text):
+        chat_id = first_chat + i
+        async with semaphore:
+            sent[chat_id] = time.perf_counter()
+            async with session.post(url, json=update(chat_id, chat_id, text)) as response:
+                response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(post(i, text) for i, text in enumerate(questions)))
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline and any(chat_id not in telegram.replies for chat_id in sent):
+        await asyncio.sleep(0.01)
+    replies = {chat_id: telegram.replies[chat_id] for chat_id in sent if chat_id in telegram.replies}
+    finished = max((at for at, _ in replies.values()), default=time.perf_counter())
+    latencies = sorted(replies[chat_id][0] - sent[chat_id] for chat_id in replies)
+    busy = sum(1 for _, text in replies.values() if text.startswith('Сейчас много'))
+    errors = sum(1 for _, text in replies.values() if not text.strip().lstrip('-').isdigit()) - busy
+    return len(replies), busy, errors, finished - started, latencies
+
+
+async def wait_ready(session, url: str, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status in (200, 405):
+                    return True
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def run(workers: int, args, telegram, api_url, ollama_url, warmup, questions, first_chat: int):
+    store_fd, store_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(store_fd)
+    url = f'http://127.0.0.1:{args.port}/webhook'
+    env = dict(os.environ, BOT_MODE='webhook', BOT_WORKERS=str(workers), WEBHOOK_URL=url,
+               WEBHOOK_HOST='127.0.0.1', WEBHOOK_PORT=str(args.port), TELEGRAM_API_URL=api_url,
+               TELEGRAM_BOT_TOKEN=TOKEN, OLLAMA_URL=ollama_url, METRICS_PORT='0', TEMPLATE_CACHE_PATH='',
+               SHARED_STORE_PATH=store_path, RATE_LIMIT_PER_MINUTE='0', DB_QUEUE_SIZE=str(args.db_queue_size),
+               LLM_QUEUE_SIZE=str(args.db_queue_size))
+    process = subprocess.Popen([sys.executable, str(ROOT / 'bot.py')], cwd=ROOT, env=env,
+                               stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        async with aiohttp.ClientSession() as session:
+            started = time.perf_counter()
+            if not await wait_ready(session, url):
+                raise RuntimeError('бот не поднял вебхук')
+            ready = time.perf_counter() - started
+            await asyncio.sleep(args.warmup)
+            await post_all(session, url, telegram, warmup, first_chat, args.concurrency, 10.0)
+            return ready, await post_all(session, url, telegram, questions, first_chat + len(warmup),
+                                         args.concurrency, args.timeout)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(store_path + suffix):
+                os.remove(store_path + suffix)
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def main(args):
+    if not os.getenv('DATABASE_URL'):
+        sys.exit(1)
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        creator_ids = json.load(f)['creator_ids']
+    rng = random.Random(args.seed)
+    telegram = FakeTelegram()
+    api_url = await telegram.start()
+    stub = StubOllama(args.llm_latency, parallel=args.llm_parallel)
+    ollama_url = await stub.start()
+    report = []
+    try:
+        for index, workers in enumerate(int(n) for n in args.workers.split(',')):
+            warmup = make_questions(workers * 20, creator_ids, 0.0, rng)
+            questions = make_questions(args.messages, creator_ids, args.llm_share, rng)
+            ready, (answered, busy, errors, elapsed, latencies) = await run(
+                workers, args, telegram, api_url, ollama_url, warmup, questions, (index + 1) * 10 ** 7)
+            report.append((workers, answered / elapsed))
+            print(f'воркеров {workers}: вебхук готов через {ready:.1f} с, ответов {answered}/{len(questions)} '
+                  f'(«занято» {busy}, ошибок {errors}) за {elapsed:.1f} с, {answered / elapsed:.0f} сообщений/с, '
+                  f'p50 {percentile(latencies, 0.5) * 1000:.0f} мс, p95 {percentile(latencies, 0.95) * 1000:.0f} мс')
+    finally:
+        await stub.stop()
+        await telegram.stop()
+    base = report[0][1]
+    print(f'\nмасштабирование относительно {report[0][0]} воркера: ' +
+          ', '.join(f'{workers} → x{rate / base:.2f}' for workers, rate in report))
+    print(f'ядер CPU: {os.cpu_count()}, setWebhook получен {len(telegram.webhooks)} раз')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный тест режима вебхука: запускает bot.py с BOT_MODE=webhook и разным числом воркеров, '
+                    'шлёт поддельные обновления Telegram и принимает ответы поддельным Bot API '
+                    '(база из DATABASE_URL, заглушка Ollama)'
+    )
+    parser.add_argument('--workers', default='1,2,4', help='числа воркеров через запятую')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64, help='одновременных POST на вебхук')
+    parser.add_argument('--llm-share', type=float, default=0.0, help='доля вопросов без быстрого пути')
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--llm-parallel', type=int, default=4)
+    parser.add_argument('--db-queue-size', type=int, default=1024, help='DB_QUEUE_SIZE и LLM_QUEUE_SIZE воркеров')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--warmup', type=float, default=1.0, help='пауза после старта, с')
+    parser.add_argument('--timeout', type=float, default=120.0, help='сколько ждать ответов, с')
+    parser.add_argument('--seed', type=int, default=3)
+    parser.add_argument('--verbose', action='store_true', help='показывать лог бота')
+    asyncio.run(main(parser.parse_args()))
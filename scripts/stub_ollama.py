@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+
+from aiohttp import web
+
+QUESTION_RE = re.compile(r'Вопрос пользователя: "(.*)"')
+TOKEN_RE = re.compile(r'\s*\S+')
+DEFAULT_SQL = 'SELECT COUNT(*) FROM videos'
+
+
+class StubOllama:
+    def __init__(self, latency: float = 1.0, parallel: int = 1, responses=None, default: str = DEFAULT_SQL,
+                 token_latency: float = 0.0, prompt_latency: float = 0.0, model_latency=None):
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.token_latency = token_latency
+        self.prompt_latency = prompt_latency
+        self.cached_prompt = ''
+        self.semaphore = asyncio.Semaphore(parallel)
+        self.responses = responses or {}
+        self.default = default
+        self.calls = 0
+        self.tokens_generated = 0
+        self.tokens_total = 0
+        self.runner = None
+
+    def response_for(self, payload):
+        m = QUESTION_RE.search(payload['messages'][-1]['content'])
+        question = m.group(1) if m else ''
+        return self.responses.get((payload.get('model'), question), self.responses.get(question, self.default))
+
+    def latency_for(self, payload):
+        return self.model_latency.get(payload.get('model'), self.latency)
+
+    def prompt_eval(self, payload):
+        prompt = '\n'.join(message['content'] for message in payload['messages'])
+        common = len(os.path.commonprefix([self.cached_prompt, prompt]))
+        self.cached_prompt = prompt if payload.get('keep_alive', '5m') not in (0, '0') else ''
+        return (len(prompt) - common) // 4, (len(prompt) - common) / 1000 * self.prompt_latency
+
+    def timings(self, prompt_tokens, prompt_seconds, tokens):
+        return {
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(prompt_seconds * 1e9),
+            'eval_count': tokens,
+            'eval_duration': int(self.token_latency * tokens * 1e9),
+        }
+
+    async def tags(self, request):
+        return web.json_response({'models': [{'name': 'stub'}]})
+
+    async def chat(self, request):
+        payload = await request.json()
+        content = self.response_for(payload)
+        tokens = TOKEN_RE.findall(content)
+        self.tokens_total += len(tokens)
+        if payload.get('stream', True):
+            return await self.stream_chat(request, payload, tokens)
+        async with self.semaphore:
+            self.calls += 1
+            prompt_tokens, prompt_seconds = self.prompt_eval(payload)
+            await asyncio.sleep(self.latency_for(payload) + prompt_seconds + self.token_latency * len(tokens))
+            self.tokens_generated += len(tokens)
+        return web.json_response({
+            'model': payload.get('model'),
+            'message': {'role': 'assistant', 'content': content},
+            'done': True,
+            **self.timings(prompt_tokens, prompt_seconds, len(tokens)),
+        })
+
+    async def stream_chat(self, request, payload, tokens):
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        async with self.semaphore:
+            self.calls += 1
+            prompt_tokens, prompt_seconds = self.prompt_eval(payload)
+            if not await self.wait(request, self.latency_for(payload) + prompt_seconds):
+                return response
+            try:
+                for token in tokens:
+                    await asyncio.sleep(self.token_latency)
+                    if request.transport is None or request.transport.is_closing():
+                        return response
+                    self.tokens_generated += 1
+                    chunk = {'model': payload.get('model'), 'message': {'role': 'assistant', 'content': token},
+                             'done': False}
+                    await response.write(json.dumps(chunk, ensure_ascii=False).encode() + b'\n')
+                done = {'model': payload.get('model'), 'message': {'role': 'assistant', 'content': ''},
+                        'done': True, **self.timings(prompt_tokens, prompt_seconds, len(tokens))}
+                await response.write(json.dumps(done).encode() + b'\n')
+            except ConnectionResetError:
+                return response
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    async def wait(request, seconds: float) -> bool:
+        deadline = asyncio.get_running_loop().time() + seconds
+        while True:
+            if request.transport is None or request.transport.is_closing():
+                return False
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return True
+            await asyncio.sleep(min(remaining, 0.01))
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/api/tags', self.tags)
+        app.router.add_post('/api/chat', self.chat)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+async def serve(args):
+    stub = StubOllama(args.latency, args.parallel, token_latency=args.token_latency,
+                      prompt_latency=args.prompt_latency)
+    url = await stub.start(args.host, args.port)
+    print(f'stub Ollama на {url}, задержка {args.latency} с + {args.token_latency} с на токен, '
+          f'параллельно {args.parallel}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Заглушка Ollama API для нагрузочных тестов и бенчмарков')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency', type=float, default=1.0, help='время до первого токена, с')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='время на каждый токен ответа, с')
+    parser.add_argument('--prompt-latency', type=float, default=0.0,
+                        help='время обработки 1000 символов промпта вне кэша префикса, с')
+    parser.add_argument('--parallel', type=int, default=1, help='сколько генераций одновременно (Ollama — одна)')
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
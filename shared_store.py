@@ -0,0 +1,106 @@
+import sqlite3
+import time
+
+from cache import MISS
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        version TEXT,
+        value TEXT NOT NULL,
+        cost REAL NOT NULL DEFAULT 0,
+        expires REAL NOT NULL,
+        PRIMARY KEY (name, key)
+    );
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        slot INTEGER NOT NULL,
+        count INTEGER NOT NULL
+    );
+"""
+
+
+class SharedStore:
+    def __init__(self, path: str = ':memory:', timeout: float = 1.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.executescript(SCHEMA)
+        self.limited = 0
+
+    def cache(self, name: str, max_size: int = 1024, ttl: float = 300.0):
+        return SharedCache(self, name, max_size, ttl)
+
+    def allow(self, key: str, limit: int, window: float = 60.0) -> bool:
+        slot = int(time.time() // window)
+        count = self.conn.execute("""
+            INSERT INTO rate_limits (key, slot, count) VALUES (?, ?, 1)
+            ON CONFLICT (key) DO UPDATE SET
+                count = CASE WHEN slot = excluded.slot THEN count + 1 ELSE 1 END,
+                slot = excluded.slot
+            RETURNING count
+        """, (key, slot)).fetchone()[0]
+        if count > limit:
+            self.limited += 1
+            return False
+        return True
+
+    def close(self):
+        self.conn.close()
+
+
+class SharedCache:
+    def __init__(self, store: SharedStore, name: str, max_size: int = 1024, ttl: float = 300.0):
+        self.conn = store.conn
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key, version=None):
+        row = self.conn.execute(
+            'SELECT value, cost FROM cache WHERE name = ? AND key = ? AND version IS ? AND expires > ?',
+            (self.name, key, None if version is None else str(version), time.time()),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        self.saved_seconds += row[1]
+        return row[0]
+
+    def set(self, key, value, cost: float = 0.0, version=None):
+        version = None if version is None else str(version)
+        if version != self.version:
+            self.conn.execute('DELETE FROM cache WHERE name = ? AND version IS NOT ?', (self.name, version))
+            self.version = version
+        self.conn.execute(
+            'INSERT OR REPLACE INTO cache (name, key, version, value, cost, expires) VALUES (?, ?, ?, ?, ?, ?)',
+            (self.name, key, version, value, cost, time.time() + self.ttl),
+        )
+        self.writes += 1
+        if self.writes % 64 == 0:
+            self.trim()
+
+    def trim(self):
+        self.conn.execute("""
+            DELETE FROM cache WHERE name = ? AND key IN (
+                SELECT key FROM cache WHERE name = ? ORDER BY expires DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.name, self.name, self.max_size))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': self.conn.execute('SELECT COUNT(*) FROM cache WHERE name = ?', (self.name,)).fetchone()[0],
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'saved_seconds': self.saved_seconds,
+        }
@@ -0,0 +1,380 @@
+import calendar
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Callable, NamedTuple, Optional
+
+from template_cache import MONTHS
+
+CREATOR_ID_RE = re.compile(r'id:?\s*([a-f0-9]{32})', re.IGNORECASE)
+YEAR_RE = re.compile(r'20\d\d')
+HOURS_RE = re.compile(r'с\s+(\d+):?\d*\s+до\s+(\d+):?\d*', re.IGNORECASE)
+THRESHOLD_RE = re.compile(r'больше\s+(\d{1,3}(?:[\s ]\d{3})+|\d+)', re.IGNORECASE)
+CREATOR_FILTER_RE = re.compile(r"creator_id\s*=\s*'[^']+'", re.IGNORECASE)
+BETWEEN_DATES_RE = re.compile(r"BETWEEN\s+'(\d{4}-\d{2}-\d{2})'\s+AND\s+'(\d{4}-\d{2}-\d{2})'", re.IGNORECASE)
+ISO_DATE_RE = re.compile(r"'(\d{4}-\d{2}-\d{2})'")
+WHITESPACE_RE = re.compile(r'\s+')
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+IDENTIFIER_RE = re.compile(r'(?<![\w$])[a-z_][a-z0-9_]*', re.IGNORECASE)
+ALIAS_RE = re.compile(r'(?=(?:\b(?:from|join)\s+[a-z_]\w*|\bas|\))\s+([a-z_][a-z0-9_]*))', re.IGNORECASE)
+
+SCHEMA_COLUMNS = {
+    'videos': {
+        'id', 'creator_id', 'video_created_at', 'views_count', 'likes_count', 'comments_count', 'reports_count',
+        'created_at', 'updated_at',
+    },
+    'video_snapshots': {
+        'id', 'video_id', 'views_count', 'likes_count', 'comments_count', 'reports_count', 'delta_views_count',
+        'delta_likes_count', 'delta_comments_count', 'delta_reports_count', 'created_at', 'updated_at',
+    },
+}
+KNOWN_IDENTIFIERS = set().union(*SCHEMA_COLUMNS.values(), SCHEMA_COLUMNS) | set('''
+    select from where and or not in is null as on join inner left right outer full cross group by having order
+    asc desc limit offset distinct all any exists union case when then else end between like ilike with filter
+    over partition true false count sum avg min max coalesce nullif round abs greatest least date extract
+    date_trunc date_part epoch hour day dow month year week interval timestamp timestamptz time zone at
+    cast int integer bigint numeric text varchar uuid now current_date make_interval hours days
+'''.split())
+
+
+def _day(word):
+    return int(word) if len(word) <= 2 and word.isdigit() else None
+
+
+def _make_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def extract_dates(values):
+    q = values['q']
+    mentions = []
+    for m in YEAR_RE.finditer(q):
+        start, end = m.span()
+        if start == 0 or not q[start - 1].isspace() or q[end:end + 1].isdigit():
+            continue
+        words = q[max(0, start - 40):start].split()
+        if words and words[-1] in MONTHS:
+            day = _day(words[-2]) if len(words) > 1 else None
+            mentions.append((words, day, MONTHS[words[-1]], int(m.group(0))))
+    return mentions
+
+
+def extract_creator_id(values):
+    m = CREATOR_ID_RE.search(values['user_query'])
+    return m.group(1) if m else None
+
+
+def extract_date(values):
+    for _, day, month, year in values['dates']:
+        if day is not None:
+            return _make_date(year, month, day)
+    return None
+
+
+def extract_month(values):
+    for _, day, month, year in values['dates']:
+        if day is None:
+            start = date(year, month, 1)
+            end = date(year, month, calendar.monthrange(year, month)[1])
+            next_start = date(year + month // 12, month % 12 + 1, 1)
+            return start, end, next_start
+    return None
+
+
+def extract_hours(values):
+    m = HOURS_RE.search(values['user_query'])
+    return (int(m.group(1)), int(m.group(2))) if m else None
+
+
+def extract_threshold(values):
+    m = THRESHOLD_RE.search(values['user_query'])
+    return int(re.sub(r'\s', '', m.group(1))) if m else None
+
+
+def extract_period(values):
+    for words, day, month, year in values['dates']:
+        if day is None or len(words) < 5 or words[-3] != 'по':
+            continue
+        if words[-5] == 'с' and _day(words[-4]) is not None:
+            start = _make_date(year, month, _day(words[-4]))
+        elif (len(words) >= 7 and words[-7] == 'с' and words[-4].isdigit()
+              and words[-5] in MONTHS and _day(words[-6]) is not None):
+            start = _make_date(int(words[-4]), MONTHS[words[-5]], _day(words[-6]))
+        else:
+            continue
+        end = _make_date(year, month, day)
+        return (start, end) if start and end else None
+    return None
+
+
+EXTRACTORS = {
+    'dates': extract_dates,
+    'creator_id': extract_creator_id,
+    'date': extract_date,
+    'month': extract_month,
+    'hours': extract_hours,
+    'threshold': extract_threshold,
+    'period': extract_period,
+}
+
+
+EXTRACTOR_TRIGGERS = {
+    'creator_id': ('id',),
+    'date': ('20',),
+    'month': ('20',),
+    'hours': (' до ',),
+    'threshold': ('больше',),
+    'period': (' по ',),
+}
+
+
+class Values(dict):
+    def __missing__(self, name):
+        value = self[name] = EXTRACTORS[name](self)
+        return value
+
+
+class Rule(NamedTuple):
+    name: str
+    keywords: tuple
+    needs: tuple
+    build: Callable
+    excludes: tuple = ()
+    applies: Optional[Callable] = None
+
+
+class Match(NamedTuple):
+    name: str
+    sql: str
+    args: list
+
+
+FIXED_RULES = [
+    Rule(
+        'creator_views_growth_hours',
+        keywords=(('вырос', 'прирост', 'изменени', 'сложить'), ('просмотр',)),
+        needs=('creator_id', 'date', 'hours'),
+        build=lambda v: (
+            "SELECT COALESCE(SUM(vs.delta_views_count), 0) FROM video_snapshots vs "
+            "JOIN videos v ON vs.video_id = v.id WHERE v.creator_id = $1::text "
+            "AND DATE(vs.created_at) = $2::date "
+            "AND EXTRACT(HOUR FROM vs.created_at) >= $3::int AND EXTRACT(HOUR FROM vs.created_at) < $4::int",
+            [v['creator_id'], v['date'], *v['hours']],
+        ),
+    ),
+    Rule(
+        'views_sum_published_month',
+        keywords=(('суммарн', 'в сумме'), ('просмотр',)),
+        excludes=('вырос', 'прирост', 'креатор', 'больше', 'меньше', 'сколько видео', 'разных'),
+        needs=('month',),
+        build=lambda v: (
+            "SELECT COALESCE(SUM(views_count), 0) FROM videos "
+            "WHERE DATE(video_created_at) BETWEEN $1::date AND $2::date",
+            [v['month'][0], v['month'][1]],
+        ),
+    ),
+    Rule(
+        'negative_views_snapshots',
+        keywords=(('замеров', 'замеры'), ('отрицательн', 'уменьшились', 'стало меньше'), ('просмотр',)),
+        needs=(),
+        build=lambda v: ("SELECT COUNT(*) FROM video_snapshots WHERE delta_views_count < 0", []),
+    ),
+    Rule(
+        'creator_publish_days_month',
+        keywords=(('разных календарных днях', 'разных днях', 'скольких днях'), ('публиковал', 'видео')),
+        needs=('creator_id', 'month'),
+        build=lambda v: (
+            "SELECT COUNT(DISTINCT DATE(video_created_at)) FROM videos "
+            "WHERE creator_id = $1::text AND video_created_at >= $2::date AND video_created_at < $3::date",
+            [v['creator_id'], v['month'][0], v['month'][2]],
+        ),
+    ),
+    Rule(
+        'creators_with_views_over',
+        keywords=(('разных креатор',), ('хотя бы одно видео', 'имеют'), ('видео',), ('просмотр',)),
+        needs=('threshold',),
+        build=lambda v: (
+            "SELECT COUNT(DISTINCT creator_id) FROM videos WHERE views_count > $1::bigint",
+            [v['threshold']],
+        ),
+    ),
+    Rule(
+        'creator_videos_period',
+        keywords=(('креатор',), ('видео', 'опубликовал')),
+        needs=('creator_id', 'period'),
+        build=lambda v: (
+            "SELECT COUNT(*) FROM videos WHERE creator_id = $1::text "
+            "AND DATE(video_created_at) BETWEEN $2::date AND $3::date",
+            [v['creator_id'], *v['period']],
+        ),
+    ),
+    Rule(
+        'creator_videos_views_over',
+        keywords=(('итоговой', 'набрали'), ('креатор',), ('просмотр',), ('видео',)),
+        needs=('creator_id', 'threshold'),
+        build=lambda v: (
+            "SELECT COUNT(*) FROM videos WHERE creator_id = $1::text AND views_count > $2::bigint",
+            [v['creator_id'], v['threshold']],
+        ),
+    ),
+]
+
+RULES_BY_NAME = {rule.name: rule for rule in FIXED_RULES}
+
+VALIDATION_RULES = [
+    Rule(
+        'creator_videos_views_final',
+        keywords=(('итоговой',), ('креатор',), ('просмотр',)),
+        needs=('creator_id', 'threshold'),
+        applies=lambda sql: 'video_snapshots' in sql.lower() or 'videos' not in sql.lower(),
+        build=RULES_BY_NAME['creator_videos_views_over'].build,
+    ),
+    RULES_BY_NAME['negative_views_snapshots'],
+]
+
+
+class RuleTable:
+    def __init__(self, rules):
+        self.rules = rules
+        self.index = {}
+        self.unindexed = 0
+        for pos, rule in enumerate(rules):
+            if rule.keywords:
+                for kw in rule.keywords[0]:
+                    self.index[kw] = self.index.get(kw, 0) | 1 << pos
+            else:
+                self.unindexed |= 1 << pos
+        self.groups = [
+            rule.keywords[1:] + tuple(EXTRACTOR_TRIGGERS[name] for name in rule.needs if name in EXTRACTOR_TRIGGERS)
+            for rule in rules
+        ]
+
+    def candidates(self, q):
+        mask = self.unindexed
+        for kw, bits in self.index.items():
+            if kw in q:
+                mask |= bits
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            pos = low.bit_length() - 1
+            for kw in self.rules[pos].excludes:
+                if kw in q:
+                    break
+            else:
+                for group in self.groups[pos]:
+                    for kw in group:
+                        if kw in q:
+                            break
+                    else:
+                        break
+                else:
+                    yield self.rules[pos]
+
+    def match(self, values, sql_query=None):
+        for rule in self.candidates(values['q']):
+            if rule.applies is not None and not rule.applies(sql_query):
+                continue
+            for name in rule.needs:
+                if values[name] is None:
+                    break
+            else:
+                sql, args = rule.build(values)
+                return Match(rule.name, sql, args)
+        return None
+
+
+fixed_rules = RuleTable(FIXED_RULES)
+validation_rules = RuleTable(VALIDATION_RULES)
+
+
+@lru_cache(maxsize=1024)
+def question_values(user_query: str):
+    return Values(user_query=user_query, q=user_query.lower())
+
+
+def match_rule(user_query: str):
+    return fixed_rules.match(question_values(user_query))
+
+
+def get_fixed_sql_for_question(user_query: str):
+    match = fixed_rules.match(question_values(user_query))
+    return (match.sql, match.args) if match else None
+
+
+def validate_and_fix_sql(sql_query: str, user_query: str):
+    values = question_values(user_query)
+    match = validation_rules.match(values, sql_query)
+    if match:
+        return match.sql, match.args
+
+    expected_creator_id = values['creator_id']
+    if expected_creator_id and expected_creator_id not in sql_query:
+        sql_query = CREATOR_FILTER_RE.sub(f"creator_id = '{expected_creator_id}'", sql_query)
+
+    period = values['period']
+    if period:
+        start_date, end_date = period[0].isoformat(), period[1].isoformat()
+        if start_date not in sql_query or end_date not in sql_query:
+            sql_normalized = BETWEEN_DATES_RE.sub(
+                f"BETWEEN '{start_date}' AND '{end_date}'", WHITESPACE_RE.sub(' ', sql_query)
+            )
+            if start_date in sql_normalized and end_date in sql_normalized:
+                sql_query = sql_normalized
+            else:
+                between_pos = sql_query.upper().find('BETWEEN')
+                if between_pos != -1:
+                    first_date_match = ISO_DATE_RE.search(sql_query, between_pos)
+                    if first_date_match:
+                        sql_query = sql_query.replace(f"'{first_date_match.group(1)}'", f"'{start_date}'", 1)
+                    and_pos = sql_query.upper().find('AND', between_pos)
+                    if and_pos != -1:
+                        second_date_match = ISO_DATE_RE.search(sql_query, and_pos)
+                        if second_date_match:
+                            sql_query = sql_query.replace(f"'{second_date_match.group(1)}'", f"'{end_date}'", 1)
+                if 'DATE(video_created_at)' not in sql_query and 'video_created_at BETWEEN' in sql_query:
+                    sql_query = sql_query.replace('video_created_at BETWEEN', 'DATE(video_created_at) BETWEEN')
+
+    return sql_query, []
+
+
+def sql_problems(sql_query: str, user_query: str):
+    sql_query, args = validate_and_fix_sql(sql_query, user_query)
+    if args:
+        return []
+    problems = []
+    if not sql_query.lstrip().upper().startswith('SELECT'):
+        problems.append('not_select')
+    code = STRING_LITERAL_RE.sub(' 0 ', sql_query)
+    if "'" in code or code.count('(') != code.count(')'):
+        problems.append('unbalanced')
+    if ';' in code.rstrip().rstrip(';'):
+        problems.append('multiple_statements')
+    if not any(re.search(rf'\b{table}\b', code) for table in SCHEMA_COLUMNS):
+        problems.append('no_table')
+    aliases = {m.group(1).lower() for m in ALIAS_RE.finditer(code)}
+    unknown = {word.lower() for word in IDENTIFIER_RE.findall(code)} - KNOWN_IDENTIFIERS - aliases
+    if unknown:
+        problems.append('unknown_identifier:' + ','.join(sorted(unknown)))
+
+    values = question_values(user_query)
+    expected = []
+    if values['creator_id']:
+        expected.append(values['creator_id'])
+    if values['period']:
+        expected += [day.isoformat() for day in values['period']]
+    elif values['date']:
+        expected.append(values['date'].isoformat())
+    elif values['month']:
+        expected.append(values['month'][0].isoformat()[:7])
+    if values['threshold'] is not None:
+        expected.append(str(values['threshold']))
+    missing = [value for value in expected if value not in sql_query]
+    if values['hours'] and not all(re.search(rf'\b{hour}\b', code) for hour in values['hours']):
+        missing.append('hours')
+    if missing:
+        problems.append('missing_value:' + ','.join(missing))
+    return problems
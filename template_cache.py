@@ -0,0 +1,187 @@
+import calendar
+import json
+import os
+import re
+from datetime import date
+
+MONTH_FORMS = {
+    1: ('январь', 'января', 'январе'),
+    2: ('февраль', 'февраля', 'феврале'),
+    3: ('март', 'марта', 'марте'),
+    4: ('апрель', 'апреля', 'апреле'),
+    5: ('май', 'мая', 'мае'),
+    6: ('июнь', 'июня', 'июне'),
+    7: ('июль', 'июля', 'июле'),
+    8: ('август', 'августа', 'августе'),
+    9: ('сентябрь', 'сентября', 'сентябре'),
+    10: ('октябрь', 'октября', 'октябре'),
+    11: ('ноябрь', 'ноября', 'ноябре'),
+    12: ('декабрь', 'декабря', 'декабре'),
+}
+MONTHS = {form: month for month, forms in MONTH_FORMS.items() for form in forms}
+MONTH_RE = '|'.join(sorted(MONTHS, key=len, reverse=True))
+
+LITERAL_RE = re.compile(
+    rf'(?P<id>\b[a-f0-9]{{32}}\b)'
+    rf'|(?P<day_range>(?P<rd1>\d{{1,2}})\s+по\s+(?P<rd2>\d{{1,2}})\s+(?P<rm>{MONTH_RE})\s+(?P<ry>\d{{4}}))'
+    rf'|(?P<date>(?P<d>\d{{1,2}})\s+(?P<dm>{MONTH_RE})\s+(?P<dy>\d{{4}}))'
+    rf'|(?P<month>\b(?P<mm>{MONTH_RE})\s+(?P<my>\d{{4}}))'
+    rf'|(?P<hours>с\s+(?P<h1>\d{{1,2}})(?::\d{{2}})?\s+до\s+(?P<h2>\d{{1,2}})(?::\d{{2}})?)'
+    rf'|(?P<num>\d{{1,3}}(?:[  ]\d{{3}})+\b|\d+)',
+    re.IGNORECASE,
+)
+SQL_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|(?<![\w.$])\d+(?![\w.])")
+WHITESPACE_RE = re.compile(r'\s+')
+
+CASTS = {'id': 'text', 'date': 'date', 'num': 'bigint'}
+
+
+def extract_literals(question: str):
+    slots = []
+    parts = []
+    pos = 0
+    for m in LITERAL_RE.finditer(question):
+        parts.append(question[pos:m.start()])
+        pos = m.end()
+        kind = m.lastgroup
+        try:
+            if kind == 'id':
+                slots.append(('id', m.group('id').lower()))
+            elif kind == 'day_range':
+                month, year = MONTHS[m.group('rm').lower()], int(m.group('ry'))
+                slots.append(('date', date(year, month, int(m.group('rd1')))))
+                slots.append(('date', date(year, month, int(m.group('rd2')))))
+                kind = 'date по date'
+            elif kind == 'date':
+                slots.append(('date', date(int(m.group('dy')), MONTHS[m.group('dm').lower()], int(m.group('d')))))
+            elif kind == 'month':
+                slots.append(('month', (int(m.group('my')), MONTHS[m.group('mm').lower()])))
+            elif kind == 'hours':
+                slots.append(('num', int(m.group('h1'))))
+                slots.append(('num', int(m.group('h2'))))
+                kind = 'с num до num'
+            else:
+                slots.append(('num', int(re.sub(r'\s', '', m.group('num')))))
+        except ValueError:
+            return None, []
+        parts.append(f'<{kind}>')
+    parts.append(question[pos:])
+    skeleton = WHITESPACE_RE.sub(' ', ''.join(parts)).strip().lower()
+    return skeleton, slots
+
+
+def slot_values(kind, value):
+    if kind == 'month':
+        year, month = value
+        start = date(year, month, 1)
+        end = date(year, month, calendar.monthrange(year, month)[1])
+        next_start = date(year + month // 12, month % 12 + 1, 1)
+        return {'start': ('date', start), 'end': ('date', end), 'next': ('date', next_start)}
+    return {'value': (kind, value)}
+
+
+def render_literal(kind, value):
+    if kind == 'num':
+        return str(value)
+    if kind == 'date':
+        return f"'{value.isoformat()}'"
+    return f"'{value}'"
+
+
+def templatize(sql_query: str, slots):
+    renderings = {}
+    for idx, (kind, value) in enumerate(slots):
+        if kind == 'num' and value < 2:
+            return None
+        for part, (part_kind, part_value) in slot_values(kind, value).items():
+            literal = render_literal(part_kind, part_value)
+            if literal in renderings:
+                return None
+            renderings[literal] = (idx, part, part_kind)
+
+    params = []
+    used_slots = set()
+    unmapped = []
+
+    def replace(m):
+        ref = renderings.get(m.group(0))
+        if ref is None:
+            if m.group(0).startswith("'"):
+                unmapped.append(m.group(0))
+            return m.group(0)
+        idx, part, part_kind = ref
+        used_slots.add(idx)
+        if [idx, part] not in params:
+            params.append([idx, part])
+        return f'${params.index([idx, part]) + 1}::{CASTS[part_kind]}'
+
+    template_sql = SQL_TOKEN_RE.sub(replace, sql_query)
+    if unmapped or len(used_slots) != len(slots):
+        return None
+    return template_sql, params
+
+
+class TemplateCache:
+    def __init__(self, path: str = 'sql_templates.json', max_size: int = 5000):
+        self.path = path
+        self.max_size = max_size
+        self.templates = {}
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.templates = json.load(f).get('templates', {})
+
+    def lookup(self, question: str):
+        skeleton, slots = extract_literals(question)
+        template = self.templates.get(skeleton) if skeleton else None
+        if template is None:
+            self.misses += 1
+            return None
+        args = [slot_values(*slots[idx])[part][1] for idx, part in template['params']]
+        template['hits'] += 1
+        self.hits += 1
+        return template['sql'], args
+
+    def store(self, question: str, sql_query: str):
+        skeleton, slots = extract_literals(question)
+        if not skeleton or skeleton in self.templates:
+            return False
+        result = templatize(sql_query, slots)
+        if result is None:
+            return False
+        template_sql, params = result
+        self.templates[skeleton] = {
+            'sql': template_sql,
+            'params': params,
+            'slots': [kind for kind, _ in slots],
+            'hits': 0,
+        }
+        self.save()
+        return True
+
+    def save(self):
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                merged = json.load(f).get('templates', {})
+            for skeleton in self.templates:
+                merged.pop(skeleton, None)
+            merged.update(self.templates)
+            self.templates = merged
+        while len(self.templates) > self.max_size:
+            del self.templates[next(iter(self.templates))]
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'templates': self.templates}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.templates),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }